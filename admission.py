@@ -0,0 +1,218 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import request, g
+from environs import Env
+from auth import AuthError, get_token_auth_header, get_verified_payload
+from json_provider import jsonify
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH
+from metrics import ADMISSION_REJECTED
+
+env = Env()
+env.read_env()
+
+# limits are per worker process; 0 turns a limit off. A worker serves
+# GUNICORN_THREADS (default 16) requests at once, and admitted plus queued
+# requests must stay below that for the excess to be turned away
+ADMISSION_READ_LIMIT = env.int('ADMISSION_READ_LIMIT', 8)
+ADMISSION_WRITE_LIMIT = env.int('ADMISSION_WRITE_LIMIT', 2)
+ADMISSION_QUEUE_SIZE = env.int('ADMISSION_QUEUE_SIZE', 2)
+ADMISSION_QUEUE_TIMEOUT = env.float('ADMISSION_QUEUE_TIMEOUT', 5)
+ADMISSION_RETRY_AFTER = env.int('ADMISSION_RETRY_AFTER', 1)
+
+# per `sub` claim, over all workers; a rate of 0 turns the token buckets
+# off. Each worker keeps its own buckets with a share of the rate, which
+# holds on average since requests are spread over the workers
+RATE_LIMIT_PER_SECOND = env.float('RATE_LIMIT_PER_SECOND', 0)
+RATE_LIMIT_BURST = env.int('RATE_LIMIT_BURST', 20)
+RATE_LIMIT_SUBJECTS = 10000
+WORKERS = max(env.int('WEB_CONCURRENCY', 1), 1)
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# monitoring must keep answering while the API sheds load
+EXEMPT_ENDPOINTS = ('index', 'health', 'metrics')
+
+
+class ConcurrencyLimiter():
+    '''ConcurrencyLimiter(name, limit, queue_size, timeout)
+        Admits at most `limit` requests at once. Up to `queue_size` more
+        wait in line for at most `timeout` seconds; beyond that, requests
+        are turned away immediately.
+    '''
+
+    def __init__(self, name, limit, queue_size=ADMISSION_QUEUE_SIZE,
+                 timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._condition = threading.Condition()
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def acquire(self):
+        'Returns None once admitted, or why the request was turned away'
+        with self._condition:
+            if self.in_flight >= self.limit:
+                if self.waiting >= self.queue_size:
+                    self.rejected += 1
+                    return 'queue_full'
+
+                self.waiting += 1
+                self.max_waiting = max(self.max_waiting, self.waiting)
+                ADMISSION_QUEUE_DEPTH.labels(self.name).inc()
+                admitted = self._condition.wait_for(
+                    lambda: self.in_flight < self.limit, self.timeout)
+                self.waiting -= 1
+                ADMISSION_QUEUE_DEPTH.labels(self.name).dec()
+
+                if not admitted:
+                    self.timed_out += 1
+                    return 'timeout'
+
+            self.in_flight += 1
+            self.admitted += 1
+
+        ADMISSION_IN_FLIGHT.labels(self.name).inc()
+        return None
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+        ADMISSION_IN_FLIGHT.labels(self.name).dec()
+
+    def stats(self):
+        'Snapshot of the limiter counters'
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'max_waiting': self.max_waiting,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out
+            }
+
+
+class TokenBuckets():
+    '''TokenBuckets(rate, burst, max_size)
+        One token bucket per subject, refilled at `rate` tokens a second up
+        to `burst`. The least recently seen subjects are forgotten first.
+    '''
+
+    def __init__(self, rate=RATE_LIMIT_PER_SECOND, burst=RATE_LIMIT_BURST,
+                 max_size=RATE_LIMIT_SUBJECTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_size = max_size
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.limited = 0
+
+    def take(self, subject):
+        'Returns 0 if a token was taken, else the seconds until the next one'
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(subject, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                self.limited += 1
+                wait = (1 - tokens) / self.rate
+
+            self._buckets[subject] = (tokens, now)
+            self._buckets.move_to_end(subject)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+
+            return wait
+
+    def stats(self):
+        with self._lock:
+            return {'subjects': len(self._buckets), 'limited': self.limited}
+
+
+limiters = {
+    'read': ConcurrencyLimiter('read', ADMISSION_READ_LIMIT),
+    'write': ConcurrencyLimiter('write', ADMISSION_WRITE_LIMIT),
+}
+token_buckets = TokenBuckets(RATE_LIMIT_PER_SECOND / WORKERS,
+                             max(math.ceil(RATE_LIMIT_BURST / WORKERS), 1))
+
+
+def rejection(status, message, retry_after):
+    response = jsonify({"success": False, "error": status,
+                        "message": message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def request_subject():
+    'The `sub` of a valid bearer token, or None'
+    try:
+        return get_verified_payload(get_token_auth_header()).get('sub')
+    except AuthError:
+        return None
+
+
+def admit():
+    if request.endpoint in EXEMPT_ENDPOINTS:
+        return None
+
+    route_class = 'read' if request.method in READ_METHODS else 'write'
+
+    if token_buckets.rate > 0:
+        subject = request_subject()
+        wait = token_buckets.take(subject) if subject else 0
+        if wait:
+            ADMISSION_REJECTED.labels(route_class, 'rate_limited').inc()
+            return rejection(429, "too many requests", wait)
+
+    limiter = limiters[route_class]
+    if limiter.limit <= 0:
+        return None
+
+    reason = limiter.acquire()
+    if reason is not None:
+        ADMISSION_REJECTED.labels(route_class, reason).inc()
+        return rejection(503, "server is overloaded, retry later",
+                         ADMISSION_RETRY_AFTER)
+
+    g.admitted_by = limiter
+    return None
+
+
+def leave(exception=None):
+    limiter = g.pop('admitted_by', None)
+    if limiter is not None:
+        limiter.release()
+
+
+def admission_stats():
+    stats = {name: limiter.stats() for name, limiter in limiters.items()}
+    stats['rate_limit'] = token_buckets.stats()
+    return stats
+
+
+def init_admission(app):
+    '''
+    init_admission(app)
+        caps the requests each worker serves at once, separately for reads
+        and writes, and rate limits each token subject when configured
+    '''
+    app.before_request(admit)
+    app.teardown_request(leave)
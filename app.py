@@ -1,9 +1,28 @@
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort
 from flask_cors import CORS
 from werkzeug.exceptions import HTTPException
-from models import setup_db, Actor, Movie
-from pagination import paginate_results
-from auth import Permissions, requires_auth
+from sqlalchemy import and_
+from sqlalchemy.orm import selectinload
+from models import setup_db, all_engines, db, Actor, Movie, CareerModel
+from models import bulk_insert, bulk_delete, bump_versions
+from models import insert_careers, delete_careers
+from db_pool import pool_monitor
+from metrics import init_metrics, metrics_response
+from query_log import init_query_log
+from replicas import init_replicas, read_replica
+from admission import init_admission, admission_stats
+from compression import init_compression
+from pagination import paginate, get_sort_order, is_keyset_request
+from pagination import get_page_args, wants_count
+from auth import Permissions, requires_auth, jwks_cache, token_cache
+from conditional import conditional
+from cache import response_cache
+from validation import validate_actor, validate_movie, validate_items
+from export import export_response
+from filters import filter_actors, filter_movies
+from search import search, SEARCH_KINDS
+from json_provider import init_json_provider, jsonify
+from fieldsets import get_fields, load_fields
 
 
 def get_json_data(attr):
@@ -11,6 +30,270 @@ def get_json_data(attr):
     return data.get(attr, None)
 
 
+BULK_MAX_ITEMS = 10000
+# ids travel in the query string, which gunicorn caps at 4094 bytes
+BULK_DELETE_MAX_IDS = 500
+
+# only indexed columns may be sorted on
+ACTOR_SORT_KEYS = {"id": Actor.id, "name": Actor.name, "age": Actor.age}
+MOVIE_SORT_KEYS = {
+    "id": Movie.id,
+    "title": Movie.title,
+    "release_date": Movie.release_date,
+}
+
+
+def get_bulk_items(name, action="created"):
+    """
+    get_bulk_items(name, action)
+        reads a JSON array, or an object holding the array under `name`;
+        `action` names what is done with the items in the size limit error
+    """
+    data = request.get_json()
+    if isinstance(data, dict):
+        data = data.get(name, None)
+
+    if not isinstance(data, list) or not data:
+        abort(400, f"a non-empty array of {name} is expected")
+
+    if len(data) > BULK_MAX_ITEMS:
+        abort(400, f"at most {BULK_MAX_ITEMS} {name} can be {action} at once")
+
+    return data
+
+
+def bulk_create(model, name, validate):
+    """
+    bulk_create(model, name, validate)
+        validates every item up front, then inserts them all in one
+        transaction. Nothing is inserted if any item is invalid.
+    """
+    rows, errors = validate_items(get_bulk_items(name), validate)
+    if errors:
+        return (
+            jsonify({
+                "success": False,
+                "error": 400,
+                "message": "invalid items",
+                "errors": errors,
+            }),
+            400,
+        )
+
+    try:
+        ids = bulk_insert(model, rows)
+        bump_versions(model.__tablename__)
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    created = [dict(row, id=id) for row, id in zip(rows, ids)]
+    return (
+        jsonify({
+            "success": True,
+            "message": "created",
+            name: created,
+            "total_created": len(created),
+        }),
+        201,
+    )
+
+
+def get_bulk_ids(name):
+    """
+    get_bulk_ids(name)
+        reads ?ids=1,2,3 as a sorted list of distinct integers
+    """
+    try:
+        ids = {int(id) for id in request.args.get("ids", "").split(",")
+               if id.strip()}
+    except ValueError:
+        abort(400, "ids must be a comma separated list of integers")
+
+    if not ids:
+        abort(400, f"ids of the {name} are expected")
+
+    if len(ids) > BULK_DELETE_MAX_IDS:
+        abort(400, f"at most {BULK_DELETE_MAX_IDS} {name} at once")
+
+    return sorted(ids)
+
+
+def bulk_remove(model, name, key):
+    """
+    bulk_remove(model, name, key)
+        deletes every listed row that exists in a constant number of
+        statements; 404 if none of them exists
+    """
+    ids = get_bulk_ids(name)
+    try:
+        deleted = bulk_delete(model, ids)
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if not deleted:
+        abort(404)
+
+    return jsonify({
+        "success": True,
+        "message": "deleted",
+        key: deleted,
+        "total_deleted": len(deleted),
+    })
+
+
+RELATED_TABLES = (Actor.__tablename__, Movie.__tablename__,
+                  CareerModel.__tablename__)
+
+
+CAREER_COLUMNS = {Actor: CareerModel.actor_id, Movie: CareerModel.movie_id}
+
+
+def get_related_ids(key):
+    """
+    get_related_ids(key)
+        reads a JSON array of ids, or an object holding it under `key`
+    """
+    ids = get_bulk_items(key, "linked")
+    if not all(isinstance(id, int) and not isinstance(id, bool)
+               for id in ids):
+        abort(400, f"{key} must be integers")
+
+    return sorted(set(ids))
+
+
+def ensure_exists(model, id):
+    if not db.session.query(model.id).filter_by(id=id).scalar():
+        abort(404)
+
+
+def link_related(owner, owner_id, related, name):
+    """
+    link_related(owner, owner_id, related, name)
+        links the posted `related` ids to one `owner` row. One IN query
+        checks that they exist and which are already linked, then the new
+        links are inserted in batches.
+    """
+    ensure_exists(owner, owner_id)
+    key = f"{related.__tablename__.lower()}_ids"
+    ids = get_related_ids(key)
+
+    owner_column = CAREER_COLUMNS[owner]
+    related_column = CAREER_COLUMNS[related]
+    rows = (db.session.query(related.id, CareerModel.id)
+            .outerjoin(CareerModel, and_(related_column == related.id,
+                                         owner_column == owner_id))
+            .filter(related.id.in_(ids))
+            .all())
+
+    missing = sorted(set(ids) - {row[0] for row in rows})
+    if missing:
+        return (
+            jsonify({
+                "success": False,
+                "error": 400,
+                "message": f"unknown {name}",
+                "missing": missing,
+            }),
+            400,
+        )
+
+    linked = sorted(id for id, career_id in rows if career_id is None)
+    try:
+        insert_careers([{owner_column.key: owner_id, related_column.key: id}
+                        for id in linked])
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return (
+        jsonify({
+            "success": True,
+            "message": "linked",
+            owner_column.key: owner_id,
+            key: linked,
+            "total_linked": len(linked),
+        }),
+        201 if linked else 200,
+    )
+
+
+def unlink_related(owner, owner_id, related, name):
+    """
+    unlink_related(owner, owner_id, related, name)
+        removes the links to the ?ids= of `related` in one statement
+    """
+    ensure_exists(owner, owner_id)
+    ids = get_bulk_ids(name)
+
+    owner_column = CAREER_COLUMNS[owner]
+    try:
+        unlinked = delete_careers(owner_column, owner_id,
+                                  CAREER_COLUMNS[related], ids)
+        db.session.commit()
+
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return jsonify({
+        "success": True,
+        "message": "unlinked",
+        owner_column.key: owner_id,
+        "total_unlinked": unlinked,
+    })
+
+
+def get_include(relationship):
+    """
+    get_include(relationship)
+        returns `relationship` if ?include= asks for it, None if absent
+    """
+    include = request.args.get("include", None)
+    if include is None:
+        return None
+
+    if include != relationship:
+        abort(400, f"only include={relationship} is supported")
+
+    return include
+
+
+def included_tables():
+    "Tables an ?include= response also depends on"
+    return RELATED_TABLES if request.args.get("include") else ()
+
+
+def format_item(item, include=None, fields=None):
+    formatted = item.format(fields)
+    if include:
+        formatted[include] = [related.format()
+                              for related in getattr(item, include)]
+
+    return formatted
+
+
+def paginated_body(name, page, include=None, fields=None):
+    body = {
+        "success": True,
+        name: [format_item(item, include, fields) for item in page.items],
+    }
+    if page.total is not None:
+        body["total_results"] = page.total
+
+    if is_keyset_request():
+        body["next_cursor"] = page.next_cursor
+
+    return body
+
+
 permissions = Permissions()
 
 
@@ -22,6 +305,12 @@ def create_app(test_config=None):
     app = Flask(__name__)
 
     setup_db(app)
+    init_json_provider(app)
+    init_query_log(app, all_engines(app))
+    init_metrics(app)
+    init_replicas(app)
+    init_admission(app)
+    init_compression(app)
     CORS(app)
 
     """
@@ -49,39 +338,71 @@ def create_app(test_config=None):
             "message": "Welcome to Capstone API."
         })
 
+    @app.route("/health")
+    def health():
+        return jsonify({
+            "success": True,
+            "pool": pool_monitor.stats(),
+            "admission": admission_stats(),
+            "caches": {
+                "jwks": jwks_cache.stats(),
+                "tokens": token_cache.stats(),
+                "responses": response_cache.stats(),
+            },
+        })
+
+    @app.route("/metrics")
+    def metrics():
+        return metrics_response()
+
     """
         Actors Endpoints
     """
 
     @app.route("/actors")
     @requires_auth(permissions.get_actors)
+    @read_replica
+    @conditional("Actor", cache=response_cache, extra_tables=included_tables)
     def get_actors(payload):
         try:
-            actors = Actor.query.all()
-            formated_actors = [actor.format() for actor in actors]
-            paginated_actors = paginate_results(formated_actors)
+            include = get_include("movies")
+            fields = get_fields(Actor)
+            query = filter_actors(Actor.query)
+            if include:
+                query = query.options(selectinload(Actor.movies))
 
-            return jsonify(
-                {
-                    "success": True,
-                    "actors": paginated_actors,
-                    "total_results": len(formated_actors),
-                }
-            )
+            order = get_sort_order(ACTOR_SORT_KEYS, Actor.id)
+            query = load_fields(query, Actor, fields, order)
+            page = paginate(query, order)
+
+            return jsonify(paginated_body("actors", page, include, fields))
+
+        except HTTPException as err:
+            abort(err.code, err.description)
 
         except Exception as ex:
             print(ex)
             abort(500)
 
+    @app.route("/actors/export")
+    @requires_auth(permissions.get_actors)
+    @conditional("Actor")
+    def export_actors(payload):
+        columns = [Actor.id, Actor.name, Actor.age, Actor.gender]
+        return export_response("actors", columns, Actor.id)
+
     @app.route("/actors/<int:actor_id>")
     @requires_auth(permissions.get_actors)
+    @read_replica
+    @conditional("Actor")
     def get_actor(payload, actor_id):
         try:
-            actor = Actor.query.get(actor_id)
+            fields = get_fields(Actor)
+            actor = load_fields(Actor.query, Actor, fields).get(actor_id)
             if not actor:
                 abort(404)
 
-            return jsonify({"success": True, "actor": actor.format()})
+            return jsonify({"success": True, "actor": actor.format(fields)})
 
         except HTTPException as err:
             abort(err.code, err.description)
@@ -91,6 +412,60 @@ def create_app(test_config=None):
             code = getattr(ex, "code", 422)
             abort(code)
 
+    @app.route("/actors/<int:actor_id>/movies")
+    @requires_auth(permissions.get_actors)
+    @read_replica
+    @conditional(*RELATED_TABLES)
+    def get_actor_movies(payload, actor_id):
+        try:
+            if not db.session.query(Actor.id).filter_by(id=actor_id).scalar():
+                abort(404)
+
+            fields = get_fields(Movie)
+            query = (filter_movies(Movie.query)
+                     .join(CareerModel, CareerModel.movie_id == Movie.id)
+                     .filter(CareerModel.actor_id == actor_id))
+            order = get_sort_order(MOVIE_SORT_KEYS, Movie.id)
+            query = load_fields(query, Movie, fields, order)
+            page = paginate(query, order)
+
+            body = paginated_body("movies", page, fields=fields)
+            body["actor_id"] = actor_id
+            return jsonify(body)
+
+        except HTTPException as err:
+            abort(err.code, err.description)
+
+        except Exception as ex:
+            print(ex)
+            abort(500)
+
+    @app.route("/actors/<int:actor_id>/movies", methods=["POST"])
+    @requires_auth(permissions.patch_actors)
+    def link_actor_movies(payload, actor_id):
+        try:
+            return link_related(Actor, actor_id, Movie, "movies")
+
+        except HTTPException as err:
+            abort(err.code, err.description)
+
+        except Exception as ex:
+            print(ex)
+            abort(422)
+
+    @app.route("/actors/<int:actor_id>/movies", methods=["DELETE"])
+    @requires_auth(permissions.patch_actors)
+    def unlink_actor_movies(payload, actor_id):
+        try:
+            return unlink_related(Actor, actor_id, Movie, "movies")
+
+        except HTTPException as err:
+            abort(err.code, err.description)
+
+        except Exception as ex:
+            print(ex)
+            abort(422)
+
     @app.route("/actors", methods=["POST"])
     @requires_auth(permissions.post_actors)
     def post_actors(payload):
@@ -122,6 +497,19 @@ def create_app(test_config=None):
             print(ex)
             abort(422)
 
+    @app.route("/actors/bulk", methods=["POST"])
+    @requires_auth(permissions.post_actors)
+    def post_actors_bulk(payload):
+        try:
+            return bulk_create(Actor, "actors", validate_actor)
+
+        except HTTPException as err:
+            abort(err.code, err.description)
+
+        except Exception as ex:
+            print(ex)
+            abort(422)
+
     @app.route("/actors/<int:actor_id>", methods=["PATCH"])
     @requires_auth(permissions.patch_actors)
     def patch_actors(payload, actor_id):
@@ -158,6 +546,19 @@ def create_app(test_config=None):
             print(ex)
             abort(422)
 
+    @app.route("/actors", methods=["DELETE"])
+    @requires_auth(permissions.delete_actors)
+    def delete_actors_bulk(payload):
+        try:
+            return bulk_remove(Actor, "actors", "actor_ids")
+
+        except HTTPException as err:
+            abort(err.code, err.description)
+
+        except Exception as ex:
+            print(ex)
+            abort(422)
+
     @app.route("/actors/<int:actor_id>", methods=["DELETE"])
     @requires_auth(permissions.delete_actors)
     def delete_actors(payload, actor_id):
@@ -189,33 +590,48 @@ def create_app(test_config=None):
 
     @app.route("/movies")
     @requires_auth(permissions.get_movies)
+    @read_replica
+    @conditional("Movie", cache=response_cache, extra_tables=included_tables)
     def get_movies(payload):
         try:
-            movies = Movie.query.all()
-            formated_movies = [movie.format() for movie in movies]
-            paginated_movies = paginate_results(formated_movies)
+            include = get_include("actors")
+            fields = get_fields(Movie)
+            query = filter_movies(Movie.query)
+            if include:
+                query = query.options(selectinload(Movie.actors))
 
-            return jsonify(
-                {
-                    "success": True,
-                    "movies": paginated_movies,
-                    "total_results": len(formated_movies),
-                }
-            )
+            order = get_sort_order(MOVIE_SORT_KEYS, Movie.id)
+            query = load_fields(query, Movie, fields, order)
+            page = paginate(query, order)
+
+            return jsonify(paginated_body("movies", page, include, fields))
+
+        except HTTPException as err:
+            abort(err.code, err.description)
 
         except Exception as ex:
             print(ex)
             abort(500)
 
+    @app.route("/movies/export")
+    @requires_auth(permissions.get_movies)
+    @conditional("Movie")
+    def export_movies(payload):
+        columns = [Movie.id, Movie.title, Movie.release_date]
+        return export_response("movies", columns, Movie.id)
+
     @app.route("/movies/<int:movie_id>")
     @requires_auth(permissions.get_movies)
+    @read_replica
+    @conditional("Movie")
     def get_movie(payload, movie_id):
         try:
-            movie = Movie.query.get(movie_id)
+            fields = get_fields(Movie)
+            movie = load_fields(Movie.query, Movie, fields).get(movie_id)
             if not movie:
                 abort(404)
 
-            return jsonify({"success": True, "movie": movie.format()})
+            return jsonify({"success": True, "movie": movie.format(fields)})
 
         except HTTPException as err:
             abort(err.code, err.description)
@@ -225,6 +641,60 @@ def create_app(test_config=None):
             code = getattr(ex, "code", 422)
             abort(code)
 
+    @app.route("/movies/<int:movie_id>/actors")
+    @requires_auth(permissions.get_movies)
+    @read_replica
+    @conditional(*RELATED_TABLES)
+    def get_movie_actors(payload, movie_id):
+        try:
+            if not db.session.query(Movie.id).filter_by(id=movie_id).scalar():
+                abort(404)
+
+            fields = get_fields(Actor)
+            query = (filter_actors(Actor.query)
+                     .join(CareerModel, CareerModel.actor_id == Actor.id)
+                     .filter(CareerModel.movie_id == movie_id))
+            order = get_sort_order(ACTOR_SORT_KEYS, Actor.id)
+            query = load_fields(query, Actor, fields, order)
+            page = paginate(query, order)
+
+            body = paginated_body("actors", page, fields=fields)
+            body["movie_id"] = movie_id
+            return jsonify(body)
+
+        except HTTPException as err:
+            abort(err.code, err.description)
+
+        except Exception as ex:
+            print(ex)
+            abort(500)
+
+    @app.route("/movies/<int:movie_id>/actors", methods=["POST"])
+    @requires_auth(permissions.patch_movies)
+    def link_movie_actors(payload, movie_id):
+        try:
+            return link_related(Movie, movie_id, Actor, "actors")
+
+        except HTTPException as err:
+            abort(err.code, err.description)
+
+        except Exception as ex:
+            print(ex)
+            abort(422)
+
+    @app.route("/movies/<int:movie_id>/actors", methods=["DELETE"])
+    @requires_auth(permissions.patch_movies)
+    def unlink_movie_actors(payload, movie_id):
+        try:
+            return unlink_related(Movie, movie_id, Actor, "actors")
+
+        except HTTPException as err:
+            abort(err.code, err.description)
+
+        except Exception as ex:
+            print(ex)
+            abort(422)
+
     @app.route("/movies", methods=["POST"])
     @requires_auth(permissions.post_movies)
     def post_movies(payload):
@@ -255,6 +725,19 @@ def create_app(test_config=None):
             print(ex)
             abort(422)
 
+    @app.route("/movies/bulk", methods=["POST"])
+    @requires_auth(permissions.post_movies)
+    def post_movies_bulk(payload):
+        try:
+            return bulk_create(Movie, "movies", validate_movie)
+
+        except HTTPException as err:
+            abort(err.code, err.description)
+
+        except Exception as ex:
+            print(ex)
+            abort(422)
+
     @app.route("/movies/<int:movie_id>", methods=["PATCH"])
     @requires_auth(permissions.patch_movies)
     def patch_movies(payload, movie_id):
@@ -287,6 +770,19 @@ def create_app(test_config=None):
             print(ex)
             abort(422)
 
+    @app.route("/movies", methods=["DELETE"])
+    @requires_auth(permissions.delete_movies)
+    def delete_movies_bulk(payload):
+        try:
+            return bulk_remove(Movie, "movies", "movie_ids")
+
+        except HTTPException as err:
+            abort(err.code, err.description)
+
+        except Exception as ex:
+            print(ex)
+            abort(422)
+
     @app.route("/movies/<int:movie_id>", methods=["DELETE"])
     @requires_auth(permissions.delete_movies)
     def delete_movies(payload, movie_id):
@@ -312,6 +808,56 @@ def create_app(test_config=None):
             print(ex)
             abort(422)
 
+    """
+        Search Endpoint
+    """
+
+    @app.route("/search")
+    @requires_auth((permissions.get_actors, permissions.get_movies))
+    @read_replica
+    def search_catalogue(payload):
+        try:
+            q = request.args.get("q", "").strip()
+            if not q:
+                abort(400, "a search query is expected")
+
+            readable = {
+                "actors": permissions.get_actors,
+                "movies": permissions.get_movies,
+            }
+            kinds = [kind for kind in SEARCH_KINDS
+                     if readable[kind] in payload["permissions"]]
+
+            requested = request.args.get("type", None)
+            if requested:
+                if requested not in SEARCH_KINDS:
+                    abort(400, "type must be actors or movies")
+                if requested not in kinds:
+                    abort(403)
+                kinds = [requested]
+
+            page, per_page = get_page_args()
+            results, total = search(q, kinds, page, per_page, wants_count())
+
+            body = {
+                "success": True,
+                "results": [
+                    {"type": kind, "rank": rank, kind: item.format()}
+                    for kind, item, rank in results
+                ],
+            }
+            if total is not None:
+                body["total_results"] = total
+
+            return jsonify(body)
+
+        except HTTPException as err:
+            abort(err.code, err.description)
+
+        except Exception as ex:
+            print(ex)
+            abort(500)
+
     """
         Error handlers
     """
@@ -1,14 +1,26 @@
+import hashlib
 import json
-from flask import request, _request_ctx_stack, abort
+import threading
+import time
+from collections import OrderedDict
+from flask import request, _request_ctx_stack, abort, g
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
+from metrics import observe, TOKEN_VERIFY_TIME, JWKS_FETCH_TIME
 
 
 AUTH0_DOMAIN = 'capstone66.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = '/agency'
 
+JWKS_URL = f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'
+JWKS_TTL = 600
+JWKS_FETCH_TIMEOUT = 3
+JWKS_MIN_REFRESH_INTERVAL = 30
+
+TOKEN_CACHE_SIZE = 4096
+
 
 class Permissions():
     '''Permissions()
@@ -47,6 +59,212 @@ class Permissions():
          {self.delete_movies}>'''
 
 
+# JWKS Cache
+
+class JWKSCache():
+    '''JWKSCache(url, ttl, timeout, min_refresh_interval)
+        Keeps the signing keys published by Auth0, indexed by `kid`.
+
+        Keys older than `ttl` seconds are still served while a background
+        thread refreshes them. An unknown `kid` triggers a synchronous
+        refresh, at most once every `min_refresh_interval` seconds. A failed
+        fetch keeps the last good key set.
+    '''
+
+    def __init__(
+        self,
+        url=JWKS_URL,
+        ttl=JWKS_TTL,
+        timeout=JWKS_FETCH_TIMEOUT,
+        min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL
+    ):
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.min_refresh_interval = min_refresh_interval
+
+        self._keys = {}
+        self._fetched_at = None
+        self._attempted_at = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def fetch(self):
+        'Download the key set and index it by kid'
+        with urlopen(self.url, timeout=self.timeout) as response:
+            jwks = json.loads(response.read())
+
+        return {
+            key['kid']: {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']
+            }
+            for key in jwks['keys'] if 'kid' in key
+        }
+
+    def refresh(self):
+        'Replace the cached keys; returns False if the fetch failed'
+        with self._refresh_lock:
+            with self._lock:
+                self._attempted_at = time.monotonic()
+
+            started = time.perf_counter()
+            try:
+                keys = self.fetch()
+            except Exception as ex:
+                print(ex)
+                observe(JWKS_FETCH_TIME, time.perf_counter() - started,
+                        'error')
+                with self._lock:
+                    self.failures += 1
+                    self._refreshing = False
+                return False
+
+            observe(JWKS_FETCH_TIME, time.perf_counter() - started, 'ok')
+            with self._lock:
+                self._keys = keys
+                self._fetched_at = time.monotonic()
+                self.refreshes += 1
+                self._refreshing = False
+            return True
+
+    def refresh_in_background(self):
+        'Start a refresh thread unless one is already running'
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        threading.Thread(target=self.refresh, daemon=True).start()
+
+    def get_key(self, kid):
+        'Return the RSA key for kid, or None if Auth0 does not publish it'
+        now = time.monotonic()
+        with self._lock:
+            key = self._keys.get(kid)
+            stale = (self._fetched_at is None
+                     or now - self._fetched_at > self.ttl)
+            may_refresh = (self._attempted_at is None
+                           or now - self._attempted_at
+                           >= self.min_refresh_interval)
+            if key:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if key:
+            if stale and may_refresh:
+                self.refresh_in_background()
+            return key
+
+        if may_refresh:
+            self.refresh()
+
+        with self._lock:
+            return self._keys.get(kid)
+
+    def stats(self):
+        'Snapshot of the cache counters'
+        with self._lock:
+            age = None
+            if self._fetched_at is not None:
+                age = time.monotonic() - self._fetched_at
+
+            return {
+                'keys': len(self._keys),
+                'age': age,
+                'hits': self.hits,
+                'misses': self.misses,
+                'refreshes': self.refreshes,
+                'failures': self.failures
+            }
+
+
+jwks_cache = JWKSCache()
+
+
+# Verified Token Cache
+
+class TokenCache():
+    '''TokenCache(max_size)
+        LRU cache of verified token payloads, keyed by a sha256 digest of
+        the token. Entries expire at the token's own `exp` claim.
+    '''
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        'Return the cached payload for token, or None'
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def set(self, token, payload):
+        'Cache a verified payload until its exp claim'
+        expires_at = payload.get('exp')
+        if not isinstance(expires_at, (int, float)):
+            return
+
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        'Snapshot of the cache counters'
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+token_cache = TokenCache()
+
+
 # AuthError Exception
 
 class AuthError(Exception):
@@ -91,8 +309,14 @@ def get_token_auth_header():
 
 
 def check_permissions(permission, payload):
+    '''check_permissions(permission, payload)
+        `permission` may also be a tuple, any one of which is enough
+    '''
+    if isinstance(permission, str):
+        permission = (permission,)
+
     if ('permissions' not in payload
-            or permission not in payload['permissions']):
+            or not set(permission) & set(payload['permissions'])):
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Not authorized to access this resource.'
@@ -102,9 +326,6 @@ def check_permissions(permission, payload):
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-
     try:
         unverified_header = jwt.get_unverified_header(token)
     except Exception as ex:
@@ -113,22 +334,13 @@ def verify_decode_jwt(token):
             'description': ex
         }, 401)
 
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'jwt malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    rsa_key = jwks_cache.get_key(unverified_header['kid'])
 
     if rsa_key:
         try:
@@ -165,18 +377,39 @@ def verify_decode_jwt(token):
     }, 401)
 
 
+def get_verified_payload(token):
+    '''get_verified_payload(token)
+        returns the payload of a verified token, skipping the signature
+        check when the token was already verified and has not expired
+    '''
+    started = time.perf_counter()
+    payload = token_cache.get(token)
+    if payload is not None:
+        observe(TOKEN_VERIFY_TIME, time.perf_counter() - started, 'hit')
+        return payload
+
+    payload = verify_decode_jwt(token)
+    token_cache.set(token, payload)
+    observe(TOKEN_VERIFY_TIME, time.perf_counter() - started, 'miss')
+
+    return payload
+
+
 def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             try:
                 token = get_token_auth_header()
-                payload = verify_decode_jwt(token)
+                payload = get_verified_payload(token)
                 check_permissions(permission, payload)
 
             except AuthError as error:
                 abort(error.status_code, description=error.error)
 
+            # replicas.py pins recent writers to the primary by subject
+            g.token_subject = payload.get('sub')
+
             return f(payload, *args, **kwargs)
 
         return wrapper
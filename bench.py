@@ -0,0 +1,332 @@
+'''
+bench.py
+    in-process microbenchmarks for the request hot path.
+
+    Runs offline: tokens are signed with a freshly generated RSA key that
+    stands in for the Auth0 key set, and each size is measured against a
+    synthetic SQLite database. Timings, allocation peaks and the memory
+    blocks each call leaves allocated are compared with a stored baseline,
+    and any regression, or a missing baseline, fails the run.
+
+    python bench.py --save                  record a baseline
+    python bench.py                         compare with the baseline
+    python bench.py --sizes 1000,100000     pick the table sizes
+'''
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from base64 import urlsafe_b64encode
+
+BASELINE_PATH = 'bench_baseline.json'
+DEFAULT_SIZES = '1000,10000,100000'
+DEFAULT_TOLERANCE = 0.25
+REPEATS = 5
+# differences below these are noise, whatever the ratio
+MIN_TIME_DELTA_US = 5
+MIN_MEMORY_DELTA_KIB = 16
+MIN_BLOCKS_DELTA = 64
+
+
+def b64_int(value):
+    raw = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+class LocalSigner():
+    '''LocalSigner()
+        RSA key pair that signs tokens the way Auth0 would
+    '''
+
+    kid = 'bench'
+
+    def __init__(self):
+        from Crypto.PublicKey import RSA
+
+        key = RSA.generate(2048)
+        self.private_pem = key.export_key().decode()
+        self.jwk = {
+            'kty': 'RSA',
+            'kid': self.kid,
+            'use': 'sig',
+            'n': b64_int(key.n),
+            'e': b64_int(key.e)
+        }
+
+    def token(self, permissions):
+        from jose import jwt
+        import auth
+
+        now = int(time.time())
+        claims = {
+            'iss': f'https://{auth.AUTH0_DOMAIN}/',
+            'aud': auth.API_AUDIENCE,
+            'sub': 'bench|1',
+            'iat': now,
+            'exp': now + 3600,
+            'permissions': permissions
+        }
+        return jwt.encode(claims, self.private_pem, algorithm='RS256',
+                          headers={'kid': self.kid})
+
+
+def install_signer(signer):
+    'Serve the local key from the JWKS cache instead of Auth0'
+    import auth
+
+    class LocalJWKSCache(auth.JWKSCache):
+        def fetch(self):
+            return {signer.kid: signer.jwk}
+
+    auth.jwks_cache = LocalJWKSCache()
+    auth.token_cache.clear()
+
+
+def measure(fn, min_time):
+    '''
+    measure(fn, min_time)
+        returns (median microseconds per call, peak KiB allocated by one
+        call, memory blocks one call leaves allocated). The loop count is
+        calibrated so each repeat takes at least min_time seconds.
+    '''
+    fn()
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed <= 0 else max(2, int(min_time / elapsed) + 1)
+
+    timings = [elapsed / loops]
+    for _ in range(REPEATS - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        timings.append((time.perf_counter() - started) / loops)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    # blocks still held after the call: caches that keep growing, leaks
+    blocks = sum(max(stat.count_diff, 0)
+                 for stat in after.compare_to(before, 'filename'))
+
+    return statistics.median(timings) * 1e6, peak / 1024, blocks
+
+
+def build_cases(app, signer, size):
+    '''
+    build_cases(app, signer, size)
+        returns [(name, fn)] for the database currently holding `size`
+        actors
+    '''
+    import flask
+    import auth
+    from cache import response_cache
+    from json_provider import JSON_PROVIDERS, ORJSONProvider, orjson
+    from models import db, Actor, Movie
+    from pagination import encode_cursor
+
+    client = app.test_client()
+    all_permissions = [
+        'get:actors', 'get:movies', 'post:actors', 'post:movies',
+        'patch:actors', 'patch:movies', 'delete:actors', 'delete:movies'
+    ]
+    token = signer.token(all_permissions)
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def get(url, extra_headers=None, cached=False):
+        def request():
+            if not cached:
+                response_cache.clear()
+            response = client.get(url, headers={**headers,
+                                                **(extra_headers or {})})
+            assert response.status_code in (200, 304), (url, response.status)
+            response.get_data()
+        return request
+
+    with app.app_context():
+        actors = Actor.query.order_by(Actor.id).limit(100).all()
+        movies = Movie.query.order_by(Movie.id).limit(100).all()
+        movie_count = Movie.query.count()
+        db.session.expunge_all()
+
+    rows = [movie.format() for movie in movies] * (1000 // len(movies) + 1)
+    body = {'success': True, 'movies': rows[:1000]}
+    providers = {name: provider() for name, provider in JSON_PROVIDERS.items()
+                 if name != ORJSONProvider.name or orjson is not None}
+
+    last_page = max(size // 10, 1)
+    middle_id = size // 2
+    etag = client.get('/actors', headers=headers).headers['ETag']
+    cursor = encode_cursor([middle_id])
+
+    return [
+        ('auth.verify_decode_jwt',
+         lambda: auth.verify_decode_jwt(token)),
+        ('auth.get_verified_payload (cached)',
+         lambda: auth.get_verified_payload(token)),
+        ('Actor.format x100',
+         lambda: [actor.format() for actor in actors]),
+        ('Movie.format x100',
+         lambda: [movie.format() for movie in movies]),
+        ('flask.jsonify x1000 movies',
+         lambda: flask.jsonify(body).get_data()),
+        *((f'{name} jsonify x1000 movies',
+           lambda provider=provider: provider.response(body).get_data())
+          for name, provider in providers.items()),
+        ('GET /actors', get('/actors')),
+        ('GET /actors (cached)', get('/actors', cached=True)),
+        ('GET /actors (304)', get('/actors', {'If-None-Match': etag})),
+        ('GET /actors?page=last', get(f'/actors?page={last_page}')),
+        ('GET /actors?page=last&count=false',
+         get(f'/actors?page={last_page}&count=false')),
+        ('GET /actors?limit=10&after=middle',
+         get(f'/actors?limit=10&after={cursor}')),
+        ('GET /actors/<id>', get(f'/actors/{middle_id}')),
+        ('GET /actors?per_page=100&fields=id,name',
+         get('/actors?per_page=100&fields=id,name')),
+        ('GET /actors?per_page=100&include=movies',
+         get('/actors?per_page=100&include=movies')),
+        ('GET /actors?per_page=100&include=movies (gzip)',
+         get('/actors?per_page=100&include=movies',
+             {'Accept-Encoding': 'gzip'})),
+        ('GET /actors/<id>/movies', get(f'/actors/{middle_id}/movies')),
+        ('GET /movies?per_page=100', get('/movies?per_page=100')),
+        ('GET /movies?sort=-release_date&limit=10',
+         get('/movies?sort=-release_date&limit=10')),
+        ('GET /movies/<id>', get(f'/movies/{max(movie_count // 2, 1)}')),
+        ('GET /search?q=kato', get('/search?q=kato')),
+    ]
+
+
+def run(sizes, min_time):
+    import auth
+    from app import create_app
+    from dataset import generate_dataset
+    from models import db, Actor
+
+    app = create_app()
+    signer = LocalSigner()
+    install_signer(signer)
+
+    results = {}
+    for size in sizes:
+        with app.app_context():
+            existing = Actor.query.count()
+            if size > existing:
+                missing = size - existing
+                generate_dataset(missing, max(missing // 5, 1),
+                                 missing * 2, seed=size)
+            db.session.remove()
+
+        for name, fn in build_cases(app, signer, size):
+            with app.app_context():
+                us, kib, blocks = measure(fn, min_time)
+            results[f'{size}: {name}'] = {'us': us, 'peak_kib': kib,
+                                          'blocks': blocks}
+            print(f'{size:>8} {name:<45} {us:>12.1f} us {kib:>10.1f} KiB '
+                  f'{blocks:>8} blocks')
+
+    print(f'jwks: {auth.jwks_cache.stats()}')
+    return results
+
+
+def compare(results, baseline, tolerance):
+    'Print the change against the baseline; returns the regressed cases'
+    regressions = []
+    print(f'\n{"case":<56} {"baseline":>10} {"now":>10} {"change":>8}')
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f'{name:<56} {"-":>10} {result["us"]:>10.1f}')
+            continue
+
+        change = result['us'] / base['us'] - 1 if base['us'] else 0
+        slower = (change > tolerance
+                  and result['us'] - base['us'] > MIN_TIME_DELTA_US)
+        heavier = (result['peak_kib'] > base['peak_kib'] * (1 + tolerance)
+                   and result['peak_kib'] - base['peak_kib']
+                   > MIN_MEMORY_DELTA_KIB)
+        base_blocks = base.get('blocks', result['blocks'])
+        retains = (result['blocks'] > base_blocks * (1 + tolerance)
+                   and result['blocks'] - base_blocks > MIN_BLOCKS_DELTA)
+
+        flag = ''
+        if slower or heavier or retains:
+            regressions.append(name)
+            flag = (' REGRESSION' + (' (memory)' if heavier else '')
+                    + (' (blocks)' if retains else ''))
+
+        print(f'{name:<56} {base["us"]:>10.1f} {result["us"]:>10.1f} '
+              f'{change:>+8.0%}{flag}')
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='comma separated actor counts')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save', action='store_true',
+                        help='write the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed slowdown, 0.25 is 25%%')
+    parser.add_argument('--min-time', type=float, default=0.1,
+                        help='seconds per timing repeat')
+    args = parser.parse_args(argv)
+
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+
+    # a run without a baseline could not fail on a regression
+    if not args.save and not os.path.exists(args.baseline):
+        print(f'no baseline at {args.baseline}; run with --save first')
+        return 2
+
+    # models reads DATABASE_URL at import time, so point it at a scratch
+    # database before anything from the app is imported
+    workdir = tempfile.mkdtemp(prefix='capstone-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{workdir}/bench.db'
+
+    results = run(sizes, args.min_time)
+
+    if args.save:
+        with open(args.baseline, 'w') as file:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cases': results
+            }, file, indent=2, sort_keys=True)
+        print(f'\nbaseline written to {args.baseline}')
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)['cases']
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) over '
+              f'{args.tolerance:.0%}:')
+        for name in regressions:
+            print(f'  {name}')
+        return 1
+
+    print('\nno regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from environs import Env
+from metrics import RESPONSE_CACHE_LOOKUPS
+
+env = Env()
+env.read_env()
+
+RESPONSE_CACHE_SIZE = env.int('RESPONSE_CACHE_SIZE', 512)
+RESPONSE_CACHE_TTL = env.float('RESPONSE_CACHE_TTL', 60)
+
+CACHE_HITS = RESPONSE_CACHE_LOOKUPS.labels('hit')
+CACHE_MISSES = RESPONSE_CACHE_LOOKUPS.labels('miss')
+
+
+class ResponseCache():
+    '''ResponseCache(max_size, ttl)
+        LRU cache of serialized responses with a time to live.
+
+        Keys are the version-derived ETags from `conditional`, so any write
+        to a table the response depends on, in any worker, changes the key
+        and the stale entry is never served again.
+    '''
+
+    def __init__(self, max_size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        'Return the cached (body, mimetype) for key, or None'
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                CACHE_MISSES.inc()
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_HITS.inc()
+            return entry[1]
+
+    def set(self, key, body, mimetype):
+        if self.max_size <= 0:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl,
+                                  (body, mimetype))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        'Snapshot of the cache counters'
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+response_cache = ResponseCache()
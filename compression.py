@@ -0,0 +1,162 @@
+import zlib
+from flask import request
+from environs import Env
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+env = Env()
+env.read_env()
+
+# smaller bodies cost more to compress than they save
+COMPRESSION_MIN_SIZE = env.int('COMPRESSION_MIN_SIZE', 1024)
+GZIP_LEVEL = env.int('GZIP_LEVEL', 6)
+BROTLI_QUALITY = env.int('BROTLI_QUALITY', 4)
+ZSTD_LEVEL = env.int('ZSTD_LEVEL', 3)
+# the server's preference when the client accepts several equally
+COMPRESSION_ENCODINGS = env.list('COMPRESSION_ENCODINGS',
+                                 ['zstd', 'br', 'gzip'])
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson',
+                          'text/csv', 'text/plain', 'text/html')
+
+
+class GzipEncoder():
+    '''GzipEncoder()
+        Incremental gzip; flush() ends a block the client can already
+        decode, finish() ends the stream
+    '''
+
+    name = 'gzip'
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder(GzipEncoder):
+    name = 'br'
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdEncoder(GzipEncoder):
+    name = 'zstd'
+
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(
+            level=ZSTD_LEVEL).compressobj()
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+ENCODERS = {
+    encoder.name: encoder
+    for encoder, module in ((GzipEncoder, zlib), (BrotliEncoder, brotli),
+                            (ZstdEncoder, zstandard))
+    if module is not None
+}
+
+
+def negotiate_encoding():
+    '''
+    negotiate_encoding()
+        the available encoding the client rates highest, ties broken by
+        COMPRESSION_ENCODINGS; None for identity
+    '''
+    accepted = request.accept_encodings
+    candidates = [
+        (accepted[name], -preference, name)
+        for preference, name in enumerate(COMPRESSION_ENCODINGS)
+        if name in ENCODERS and accepted[name] > 0
+    ]
+    return max(candidates)[2] if candidates else None
+
+
+def compress_stream(chunks, encoder):
+    'Compress each chunk as it is produced, flushing it to the client'
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = encoder.compress(chunk) + encoder.flush()
+            if data:
+                yield data
+        yield encoder.finish()
+
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or request.method == 'HEAD'
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.vary.add('Accept-Encoding')
+
+    streamed = response.is_streamed
+    if not streamed and response.content_length is not None \
+            and response.content_length < COMPRESSION_MIN_SIZE:
+        return response
+
+    name = negotiate_encoding()
+    if name is None:
+        return response
+
+    encoder = ENCODERS[name]()
+    if streamed:
+        response.response = compress_stream(response.response, encoder)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(encoder.compress(response.get_data())
+                          + encoder.finish())
+
+    response.headers['Content-Encoding'] = name
+    # the bytes differ per encoding, so a strong validator no longer fits
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    return response
+
+
+def init_compression(app):
+    '''
+    init_compression(app)
+        compresses responses with the best encoding the client accepts;
+        streamed responses are compressed chunk by chunk
+    '''
+    app.after_request(compress_response)
@@ -0,0 +1,98 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+from flask import current_app, request, make_response
+from models import get_versions
+
+
+def compute_etag(versions):
+    'Strong ETag for the current request given the table versions'
+    state = '|'.join(
+        f'{table_name}:{versions[table_name][0]}'
+        for table_name in sorted(versions)
+    )
+    raw = f'{request.full_path}|{state}'.encode()
+    return hashlib.sha1(raw).hexdigest()
+
+
+def last_modified(versions):
+    '''
+    last_modified(versions)
+        the newest table write, truncated to the second as HTTP dates are.
+        None while that second is still running: a later write in the same
+        second would get the same date and If-Modified-Since would miss it.
+    '''
+    dates = [updated_at for _, updated_at in versions.values() if updated_at]
+    if not dates:
+        return None
+
+    modified = max(dates).replace(microsecond=0)
+    if modified >= datetime.utcnow().replace(microsecond=0):
+        return None
+
+    return modified
+
+
+def is_not_modified(etag, modified):
+    if request.if_none_match:
+        # weak comparison, so compressed variants still match
+        return request.if_none_match.contains_weak(etag)
+
+    since = request.if_modified_since
+    if since and modified:
+        return modified <= since.replace(tzinfo=None)
+
+    return False
+
+
+def cached_response(cache, etag, f, *args, **kwargs):
+    'Serve a 200 response from cache, calling f on a miss'
+    entry = cache.get(etag)
+    if entry is not None:
+        body, mimetype = entry
+        return current_app.response_class(body, mimetype=mimetype)
+
+    response = make_response(f(*args, **kwargs))
+    if response.status_code == 200 and not response.is_streamed:
+        cache.set(etag, response.get_data(), response.mimetype)
+
+    return response
+
+
+def conditional(*table_names, cache=None, extra_tables=None):
+    '''
+    conditional(*table_names, cache=None, extra_tables=None)
+        decorator for GET handlers whose response only depends on the rows
+        of `table_names`, plus those returned by `extra_tables()` for the
+        current request. The ETag and Last-Modified validators come from
+        the table versions, so a 304 is answered before any row is loaded.
+        With a ResponseCache, full responses are also reused until one of
+        the tables changes.
+    '''
+    def conditional_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            tables = table_names
+            if extra_tables is not None:
+                tables = tables + tuple(extra_tables())
+
+            versions = get_versions(*tables)
+            etag = compute_etag(versions)
+            modified = last_modified(versions)
+
+            if is_not_modified(etag, modified):
+                response = make_response('', 304)
+            elif cache is not None:
+                response = cached_response(cache, etag, f, *args, **kwargs)
+            else:
+                response = make_response(f(*args, **kwargs))
+
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                if modified:
+                    response.last_modified = modified
+
+            return response
+
+        return wrapper
+    return conditional_decorator
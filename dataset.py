@@ -0,0 +1,136 @@
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+from sqlalchemy import func
+from models import db, Actor, Movie, CareerModel, bump_versions
+from importer import load_rows, sync_id_sequence
+
+GENERATE_BATCH_SIZE = 10000
+
+FIRST_NAMES = [
+    'Ada', 'Ben', 'Cara', 'Dev', 'Ezra', 'Fay', 'Gus', 'Hana', 'Ivo', 'Jun',
+    'Kai', 'Lea', 'Milo', 'Nia', 'Otto', 'Pia', 'Quin', 'Rae', 'Sol', 'Tess',
+    'Uma', 'Vic', 'Wren', 'Xan', 'Yara', 'Zed',
+]
+LAST_NAMES = [
+    'Abara', 'Bishop', 'Chen', 'Dorne', 'Eze', 'Falk', 'Garcia', 'Holt',
+    'Ivers', 'Jonas', 'Kato', 'Lund', 'Moreau', 'Nakamura', 'Okafor',
+    'Patel', 'Quist', 'Rossi', 'Silva', 'Tanaka', 'Ueda', 'Voss', 'Walsh',
+    'Xu', 'Young', 'Zima',
+]
+TITLE_WORDS = [
+    'Silent', 'Crimson', 'Last', 'Broken', 'Golden', 'Hidden', 'Distant',
+    'Iron', 'Midnight', 'Wild', 'Empire', 'River', 'Shadow', 'Garden',
+    'Horizon', 'Storm', 'Harbor', 'Echo', 'Frontier', 'Legacy',
+]
+GENDERS = ['male', 'female', 'non-binary']
+GENDER_WEIGHTS = [48, 48, 4]
+
+FIRST_RELEASE = datetime(1950, 1, 1)
+RELEASE_SPAN_DAYS = 75 * 365
+
+
+def generate_actors(rng, count, start_id):
+    for id in range(start_id, start_id + count):
+        yield {
+            'id': id,
+            'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} '
+                    f'{rng.randrange(10000)}',
+            'age': int(rng.triangular(18, 90, 30)),
+            'gender': rng.choices(GENDERS, GENDER_WEIGHTS)[0],
+        }
+
+
+def generate_movies(rng, count, start_id):
+    for id in range(start_id, start_id + count):
+        # releases get more frequent towards the present
+        days = int(rng.triangular(0, RELEASE_SPAN_DAYS, RELEASE_SPAN_DAYS))
+        yield {
+            'id': id,
+            'title': f'{rng.choice(TITLE_WORDS)} {rng.choice(TITLE_WORDS)} '
+                     f'{rng.randrange(1000)}',
+            'release_date': FIRST_RELEASE + timedelta(days=days),
+        }
+
+
+def generate_careers(rng, count, actor_ids, movie_ids, skew=1.1):
+    '''
+    generate_careers(rng, count, actor_ids, movie_ids, skew)
+        yields about `count` distinct (actor_id, movie_id) links. Cast
+        sizes are log-normal and actors are drawn with Zipf weights, so a
+        few actors are very prolific and most appear in a handful of movies.
+    '''
+    if not count or not actor_ids or not movie_ids:
+        return
+
+    actors = list(actor_ids)
+    rng.shuffle(actors)
+    cum_weights = list(accumulate(
+        1 / rank ** skew for rank in range(1, len(actors) + 1)))
+
+    mean_cast = count / len(movie_ids)
+    for movie_id in movie_ids:
+        size = int(rng.lognormvariate(0, 0.75) * mean_cast * 0.75 + 0.5)
+        size = min(max(size, 1), len(actors))
+
+        cast = set()
+        for _ in range(4):
+            cast.update(rng.choices(
+                actors, cum_weights=cum_weights, k=size - len(cast)))
+            if len(cast) >= size:
+                break
+
+        for actor_id in sorted(cast):
+            yield {'actor_id': actor_id, 'movie_id': movie_id}
+
+
+def next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def load_generated(model, rows, batch_size=GENERATE_BATCH_SIZE):
+    'Write generated rows through the bulk import path, one batch per commit'
+    loaded = 0
+    started = time.monotonic()
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+
+        try:
+            load_rows(model, batch)
+            bump_versions(model.__tablename__)
+            db.session.commit()
+
+        except Exception:
+            db.session.rollback()
+            raise
+
+        loaded += len(batch)
+        elapsed = time.monotonic() - started
+        print(f'{model.__tablename__}: {loaded} rows, '
+              f'{loaded / elapsed if elapsed else 0:.0f} rows/s')
+
+    sync_id_sequence(model)
+    return loaded
+
+
+def generate_dataset(actors, movies, careers, seed=0,
+                     batch_size=GENERATE_BATCH_SIZE):
+    '''
+    generate_dataset(actors, movies, careers, seed, batch_size)
+        appends a deterministic synthetic dataset to the configured
+        database; the same seed and sizes always produce the same rows
+    '''
+    actor_start = next_id(Actor)
+    movie_start = next_id(Movie)
+
+    load_generated(Actor, generate_actors(
+        random.Random(f'{seed}:actors'), actors, actor_start), batch_size)
+    load_generated(Movie, generate_movies(
+        random.Random(f'{seed}:movies'), movies, movie_start), batch_size)
+    load_generated(CareerModel, generate_careers(
+        random.Random(f'{seed}:careers'), careers,
+        range(actor_start, actor_start + actors),
+        range(movie_start, movie_start + movies)), batch_size)
@@ -0,0 +1,169 @@
+import threading
+import time
+from weakref import WeakSet
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, NullPool
+from environs import Env
+from metrics import DB_POOL_IN_USE, DB_POOL_WAITING, DB_POOL_WAIT_TIME
+from metrics import observe
+
+env = Env()
+env.read_env()
+
+# a pool size of 0 disables pooling, for when PgBouncer does it instead
+DB_POOL_SIZE = env.int('DB_POOL_SIZE', 5)
+DB_MAX_OVERFLOW = env.int('DB_MAX_OVERFLOW', 10)
+DB_POOL_TIMEOUT = env.float('DB_POOL_TIMEOUT', 30)
+DB_POOL_RECYCLE = env.int('DB_POOL_RECYCLE', 1800)
+DB_POOL_PRE_PING = env.bool('DB_POOL_PRE_PING', True)
+# milliseconds, 0 means no limit. Sent as the libpq `options` startup
+# parameter, which PgBouncer rejects; set it on the role there instead
+DB_STATEMENT_TIMEOUT = env.int('DB_STATEMENT_TIMEOUT', 0)
+
+
+class PoolMonitor():
+    '''PoolMonitor()
+        Gauges and counters for connection checkouts, shared by every
+        engine attached to it.
+
+        `waiting` is the number of callers blocked on a checkout right now
+        and `wait_seconds` their accumulated wait, so a rising average wait
+        means workers are queueing on the pool.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines = WeakSet()
+
+        self.in_use = 0
+        self.max_in_use = 0
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def attach(self, engine):
+        'Count checkouts and checkins of the engine pool'
+        with self._lock:
+            if engine in self._engines:
+                return
+            self._engines.add(engine)
+
+        event.listen(engine, 'checkout', self.on_checkout)
+        event.listen(engine, 'checkin', self.on_checkin)
+
+    def on_checkout(self, dbapi_connection, record, proxy):
+        with self._lock:
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+        DB_POOL_IN_USE.inc()
+
+    def on_checkin(self, dbapi_connection, record):
+        with self._lock:
+            checked_out = self.in_use > 0
+            self.in_use = max(self.in_use - 1, 0)
+        if checked_out:
+            DB_POOL_IN_USE.dec()
+
+    def start_wait(self):
+        with self._lock:
+            self.waiting += 1
+        DB_POOL_WAITING.inc()
+
+    def end_wait(self, seconds, timed_out=False):
+        with self._lock:
+            self.waiting -= 1
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+        DB_POOL_WAITING.dec()
+        observe(DB_POOL_WAIT_TIME, seconds, 'timeout' if timed_out else 'ok')
+
+    def stats(self):
+        'Snapshot of the pool gauges'
+        with self._lock:
+            pools = [engine.pool for engine in self._engines
+                     if isinstance(engine.pool, QueuePool)]
+            return {
+                'size': sum(pool.size() for pool in pools),
+                'idle': sum(pool.checkedin() for pool in pools),
+                'overflow': sum(max(pool.overflow(), 0) for pool in pools),
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'waiting': self.waiting,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds': self.wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds,
+                'avg_wait_seconds': (self.wait_seconds / self.checkouts
+                                     if self.checkouts else 0.0)
+            }
+
+
+pool_monitor = PoolMonitor()
+
+
+class MonitoredQueuePool(QueuePool):
+    '''MonitoredQueuePool(creator, **kwargs)
+        QueuePool that reports how long each checkout waited
+    '''
+
+    def timed(self, checkout):
+        pool_monitor.start_wait()
+        started = time.perf_counter()
+        try:
+            connection = checkout()
+
+        except exc.TimeoutError:
+            pool_monitor.end_wait(time.perf_counter() - started, True)
+            raise
+
+        except Exception:
+            pool_monitor.end_wait(time.perf_counter() - started)
+            raise
+
+        pool_monitor.end_wait(time.perf_counter() - started)
+        return connection
+
+    def connect(self):
+        return self.timed(super().connect)
+
+    def unique_connection(self):
+        # what Engine.connect() checks out through
+        return self.timed(super().unique_connection)
+
+
+def engine_options(database_path):
+    '''
+    engine_options(database_path)
+        SQLAlchemy engine options for a PostgreSQL URL, read from the
+        environment; other databases keep their driver defaults
+    '''
+    if not database_path.startswith('postgres'):
+        return {}
+
+    options = {
+        # batch executemany() into multi-row INSERTs
+        'executemany_mode': 'values',
+        'pool_pre_ping': DB_POOL_PRE_PING
+    }
+
+    if DB_POOL_SIZE > 0:
+        options.update({
+            'poolclass': MonitoredQueuePool,
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_timeout': DB_POOL_TIMEOUT,
+            'pool_recycle': DB_POOL_RECYCLE
+        })
+    else:
+        options['poolclass'] = NullPool
+
+    if DB_STATEMENT_TIMEOUT > 0:
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+        }
+
+    return options
@@ -0,0 +1,45 @@
+from flask import request, abort
+from sqlalchemy.orm import load_only
+
+
+def get_fields(model):
+    '''
+    get_fields(model)
+        parses ?fields=a,b against model.FIELDS; None when absent, meaning
+        every field
+    '''
+    fields = request.args.get('fields', None)
+    if fields is None:
+        return None
+
+    selected = []
+    for name in fields.split(','):
+        name = name.strip()
+        if not name or name in selected:
+            continue
+
+        if name not in model.FIELDS:
+            abort(400, f'cannot select field {name}')
+
+        selected.append(name)
+
+    if not selected:
+        abort(400, 'at least one field is expected')
+
+    return selected
+
+
+def load_fields(query, model, fields, order=()):
+    '''
+    load_fields(query, model, fields, order)
+        restricts the loaded columns to `fields` plus the sort columns the
+        cursor is built from; the primary key is always loaded
+    '''
+    if fields is None:
+        return query
+
+    keys = set(fields)
+    keys.update(column.key for column, _ in order)
+
+    return query.options(load_only(*[getattr(model, key)
+                                     for key in model.FIELDS if key in keys]))
@@ -0,0 +1,91 @@
+from flask import request, abort
+from sqlalchemy import or_
+from models import Actor, Movie
+from validation import GENDERS, parse_date
+
+
+def prefix_pattern(prefix):
+    'LIKE pattern matching values that start with prefix'
+    escaped = (prefix.replace('\\', '\\\\')
+               .replace('%', '\\%')
+               .replace('_', '\\_'))
+    return escaped + '%'
+
+
+def get_int_arg(name):
+    value = request.args.get(name, None)
+    if value is None:
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        abort(400, f'{name} must be an integer')
+
+
+def get_date_arg(name):
+    value = request.args.get(name, None)
+    if value is None:
+        return None
+
+    try:
+        return parse_date(value)
+    except ValueError:
+        abort(400, f'{name} must be a date')
+
+
+def filter_actors(query):
+    '''
+    filter_actors(query)
+        applies ?name= (prefix), ?age_min=, ?age_max= and ?gender= in SQL
+    '''
+    name = request.args.get('name', None)
+    age_min = get_int_arg('age_min')
+    age_max = get_int_arg('age_max')
+    gender = request.args.get('gender', None)
+
+    if name:
+        query = query.filter(
+            Actor.name.like(prefix_pattern(name), escape='\\'))
+
+    if age_min is not None:
+        query = query.filter(Actor.age >= age_min)
+
+    if age_max is not None:
+        query = query.filter(Actor.age <= age_max)
+
+    if gender is not None:
+        if gender not in GENDERS:
+            abort(400, f'gender must be one of {", ".join(GENDERS)}')
+
+        if gender == 'non-binary':
+            # actors without a gender are presented as non-binary
+            query = query.filter(or_(Actor.gender == gender,
+                                     Actor.gender.is_(None)))
+        else:
+            query = query.filter(Actor.gender == gender)
+
+    return query
+
+
+def filter_movies(query):
+    '''
+    filter_movies(query)
+        applies ?title= (prefix), ?released_after= and ?released_before=
+        (both inclusive) in SQL
+    '''
+    title = request.args.get('title', None)
+    released_after = get_date_arg('released_after')
+    released_before = get_date_arg('released_before')
+
+    if title:
+        query = query.filter(
+            Movie.title.like(prefix_pattern(title), escape='\\'))
+
+    if released_after is not None:
+        query = query.filter(Movie.release_date >= released_after)
+
+    if released_before is not None:
+        query = query.filter(Movie.release_date <= released_before)
+
+    return query
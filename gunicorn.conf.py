@@ -0,0 +1,38 @@
+'''
+gunicorn.conf.py
+    runs threaded workers, so admission control has concurrent requests
+    to limit within each worker, and gives the workers a shared directory
+    for their metric samples, so /metrics reports the sum over every
+    worker process
+'''
+import os
+import shutil
+import tempfile
+from environs import Env
+
+env = Env()
+env.read_env()
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                      os.path.join(tempfile.gettempdir(), 'capstone-metrics'))
+# admission.py divides the per-subject rate limit between the workers
+os.environ.setdefault('WEB_CONCURRENCY', '2')
+
+workers = env.int('WEB_CONCURRENCY')
+worker_class = 'gthread'
+# the admission defaults (8 reads, 2 writes, 2 queued of each) leave two
+# threads free to answer 503s and /health while the limits are reached
+threads = env.int('GUNICORN_THREADS', 16)
+
+
+def on_starting(server):
+    'Drop the samples of a previous run'
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,241 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import text
+from models import db, Actor, Movie, CareerModel, ImportCheckpoint
+from models import bump_versions, insert_careers
+from validation import validate_actor, validate_movie, validate_career
+
+IMPORT_BATCH_SIZE = 10000
+# careers are loaded through this table on PostgreSQL, see copy_careers
+CAREER_STAGING = 'CareerImport'
+
+IMPORT_TABLES = {
+    'actors': (Actor, validate_actor),
+    'movies': (Movie, validate_movie),
+    'careers': (CareerModel, validate_career),
+}
+
+
+def read_records(path, file_format=None):
+    '''
+    read_records(path, file_format)
+        yields (line_number, record) from a CSV file with a header row or
+        from an NDJSON file, one record at a time. An NDJSON line that is
+        not valid JSON is yielded as the ValueError describing it, so the
+        caller skips it like any other invalid record.
+    '''
+    file_format = file_format or os.path.splitext(path)[1].lstrip('.')
+
+    with open(path, newline='') as file:
+        if file_format == 'csv':
+            reader = csv.DictReader(file)
+            for record in reader:
+                yield reader.line_num, record
+
+        elif file_format in ('ndjson', 'jsonl'):
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+
+                try:
+                    record = json.loads(line)
+                except ValueError as ex:
+                    record = ValueError(f'invalid JSON: {ex}')
+                yield line_number, record
+
+        else:
+            raise ValueError(f'unsupported file format: {file_format}')
+
+
+def copy_rows(table_name, rows):
+    'Load rows with PostgreSQL COPY on the session connection'
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f'COPY "{table_name}" ({column_list}) FROM STDIN '
+            'WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+
+def copy_careers(rows):
+    '''
+    copy_careers(rows)
+        COPYs career rows into a staging table, then moves over the ones
+        linking an existing actor and movie that are not linked yet.
+        Returns the number of rows inserted.
+    '''
+    columns = ', '.join(f'"{column}"' for column in rows[0])
+    db.session.execute(text(
+        f'CREATE TEMPORARY TABLE IF NOT EXISTS "{CAREER_STAGING}" '
+        '(id integer, actor_id integer, movie_id integer) ON COMMIT DROP'))
+    db.session.execute(text(f'TRUNCATE "{CAREER_STAGING}"'))
+    copy_rows(CAREER_STAGING, rows)
+
+    staged = ', '.join(f'staged."{column}"' for column in rows[0])
+    return db.session.execute(text(
+        f'''INSERT INTO "{CareerModel.__tablename__}" ({columns})
+           SELECT DISTINCT {staged} FROM "{CAREER_STAGING}" staged
+           JOIN "Actor" ON "Actor".id = staged.actor_id
+           JOIN "Movie" ON "Movie".id = staged.movie_id
+           ON CONFLICT DO NOTHING''')).rowcount
+
+
+def existing_ids(model, ids, chunk_size=500):
+    'The subset of ids that are rows of model'
+    ids = sorted(set(ids))
+    found = set()
+    for start in range(0, len(ids), chunk_size):
+        found.update(id for id, in db.session.query(model.id).filter(
+            model.id.in_(ids[start:start + chunk_size])))
+    return found
+
+
+def insert_known_careers(rows):
+    'Insert the career rows whose actor and movie exist; returns the count'
+    actors = existing_ids(Actor, [row['actor_id'] for row in rows])
+    movies = existing_ids(Movie, [row['movie_id'] for row in rows])
+    return insert_careers([row for row in rows if row['actor_id'] in actors
+                           and row['movie_id'] in movies])
+
+
+def load_rows(model, rows):
+    '''
+    load_rows(model, rows)
+        writes rows in the current transaction: COPY on PostgreSQL and
+        executemany elsewhere, and returns the number of rows written.
+        Rows are grouped by their set of columns, since some may carry an
+        explicit id and others not. Careers that are already linked, or
+        that name a missing actor or movie, are left out instead of
+        failing the batch.
+    '''
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(row)
+
+    postgres = db.engine.dialect.name == 'postgresql'
+    written = 0
+    for group in groups.values():
+        if model is CareerModel:
+            written += (copy_careers if postgres
+                        else insert_known_careers)(group)
+        elif postgres:
+            copy_rows(model.__tablename__, group)
+            written += len(group)
+        else:
+            db.session.execute(model.__table__.insert(), group)
+            written += len(group)
+
+    return written
+
+
+def sync_id_sequence(model):
+    'Move the PostgreSQL serial sequence past explicitly loaded ids'
+    if db.engine.dialect.name != 'postgresql':
+        return
+
+    table = model.__tablename__
+    db.session.execute(text(
+        f'''SELECT setval(pg_get_serial_sequence('"{table}"', 'id'),
+                          COALESCE((SELECT MAX(id) FROM "{table}"), 0) + 1,
+                          false)'''))
+    db.session.commit()
+
+
+def read_checkpoint(name):
+    'Number of input records already committed under `name`'
+    if not name:
+        return 0
+
+    checkpoint = db.session.query(ImportCheckpoint).get(name)
+    return checkpoint.records if checkpoint else 0
+
+
+def save_checkpoint(name, records):
+    'Record how many input records are committed; the caller commits'
+    if not name:
+        return
+
+    db.session.merge(ImportCheckpoint(name=name, records=records,
+                                      updated_at=datetime.utcnow()))
+
+
+def keep_id(record, row):
+    if record.get('id') not in (None, ''):
+        row['id'] = int(record['id'])
+    return row
+
+
+def import_file(path, table, file_format=None,
+                batch_size=IMPORT_BATCH_SIZE, checkpoint=None):
+    '''
+    import_file(path, table, file_format, batch_size, checkpoint)
+        streams a file into `table` in fixed-size batches. Each batch is
+        committed in one transaction with the ImportCheckpoint row named
+        `checkpoint`, so an interrupted import resumes after the last
+        committed batch. Invalid records are reported and skipped.
+        Returns (imported, skipped).
+    '''
+    model, validate = IMPORT_TABLES[table]
+    done = read_checkpoint(checkpoint)
+    records = islice(read_records(path, file_format), done, None)
+
+    imported = skipped = 0
+    started = time.monotonic()
+    if done:
+        print(f'resuming after {done} records')
+
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+
+        rows = []
+        for line_number, record in batch:
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                rows.append(keep_id(record, validate(record)))
+            except (ValueError, TypeError) as ex:
+                skipped += 1
+                print(f'line {line_number}: {ex}')
+
+        try:
+            written = load_rows(model, rows) if rows else 0
+            if written:
+                bump_versions(model.__tablename__)
+            save_checkpoint(checkpoint, done + len(batch))
+            db.session.commit()
+
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if written < len(rows):
+            print(f'lines {batch[0][0]}-{batch[-1][0]}: '
+                  f'{len(rows) - written} {table} already linked or '
+                  'naming a missing actor or movie')
+
+        done += len(batch)
+        imported += written
+        skipped += len(rows) - written
+
+        elapsed = time.monotonic() - started
+        print(f'{imported} rows imported, '
+              f'{imported / elapsed if elapsed else 0:.0f} rows/s')
+
+    sync_id_sequence(model)
+    return imported, skipped
@@ -0,0 +1,88 @@
+import json
+from datetime import date
+from flask import current_app
+from environs import Env
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+env = Env()
+env.read_env()
+
+JSON_PROVIDER = env.str('JSON_PROVIDER', 'orjson' if orjson else 'json')
+
+
+def default(obj):
+    'Serialize what the json module cannot; dates become ISO-8601'
+    if isinstance(obj, date):
+        return obj.isoformat()
+
+    raise TypeError(f'{type(obj).__name__} is not JSON serializable')
+
+
+class JSONProvider():
+    '''JSONProvider()
+        Serializes API responses with the standard library. Keys are
+        sorted, as flask.jsonify sorts them, so every provider writes the
+        same bytes.
+    '''
+
+    name = 'json'
+    mimetype = 'application/json'
+
+    def dumps(self, obj):
+        return json.dumps(obj, default=default, sort_keys=True,
+                          separators=(',', ':')).encode()
+
+    def response(self, obj, status=None):
+        return current_app.response_class(
+            self.dumps(obj), status=status, mimetype=self.mimetype)
+
+
+class ORJSONProvider(JSONProvider):
+    '''ORJSONProvider()
+        Serializes API responses with orjson, which writes datetimes as
+        ISO-8601 natively
+    '''
+
+    name = 'orjson'
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=default,
+                            option=orjson.OPT_SORT_KEYS)
+
+
+JSON_PROVIDERS = {
+    JSONProvider.name: JSONProvider,
+    ORJSONProvider.name: ORJSONProvider,
+}
+
+
+def init_json_provider(app, name=JSON_PROVIDER):
+    '''
+    init_json_provider(app, name)
+        installs the JSON provider used by jsonify, falling back to the
+        standard library when orjson is not installed
+    '''
+    if name == ORJSONProvider.name and orjson is None:
+        name = JSONProvider.name
+
+    app.extensions['json_provider'] = JSON_PROVIDERS[name]()
+
+
+def jsonify(*args, **kwargs):
+    '''
+    jsonify(*args, **kwargs)
+        drop-in for flask.jsonify that serializes with the app's provider
+    '''
+    if args and kwargs:
+        raise TypeError('jsonify() takes either args or kwargs, not both')
+
+    if len(args) == 1:
+        data = args[0]
+    else:
+        data = args or kwargs
+
+    return current_app.extensions['json_provider'].response(data)
@@ -1,9 +1,13 @@
-from flask_script import Manager
+import os
+from flask_script import Manager, Command, Option
 from flask_migrate import Migrate, Manager, MigrateCommand
 from sqlalchemy.orm import Session
 
 from app import APP
-from models import db, Actor, Movie, CareerModel
+from models import db, Actor, Movie, bump_versions
+from models import insert_careers
+from importer import import_file, IMPORT_TABLES, IMPORT_BATCH_SIZE
+from dataset import generate_dataset, GENERATE_BATCH_SIZE
 
 migrate = Migrate(APP, db)
 manager = Manager(APP)
@@ -11,6 +15,49 @@ manager = Manager(APP)
 manager.add_command('db', MigrateCommand)
 
 
+class Import(Command):
+    "Stream a CSV/NDJSON file of actors, movies or careers into the database"
+
+    option_list = (
+        Option('path', help='CSV file with a header row, or NDJSON file'),
+        Option('-t', '--table', dest='table', required=True,
+               choices=sorted(IMPORT_TABLES)),
+        Option('-f', '--format', dest='file_format', default=None,
+               choices=['csv', 'ndjson'],
+               help='defaults to the file extension'),
+        Option('-b', '--batch-size', dest='batch_size', type=int,
+               default=IMPORT_BATCH_SIZE),
+        Option('-c', '--checkpoint', dest='checkpoint', default=None,
+               help='resume name; defaults to <table>:<absolute path>'),
+    )
+
+    def run(self, path, table, file_format, batch_size, checkpoint):
+        imported, skipped = import_file(
+            path, table, file_format, batch_size,
+            checkpoint or f'{table}:{os.path.abspath(path)}')
+        print(f'done: {imported} rows imported, {skipped} skipped')
+
+
+class Generate(Command):
+    "Add a deterministic synthetic dataset for scale testing"
+
+    option_list = (
+        Option('-a', '--actors', dest='actors', type=int, default=10000),
+        Option('-m', '--movies', dest='movies', type=int, default=2000),
+        Option('-c', '--careers', dest='careers', type=int, default=100000),
+        Option('-s', '--seed', dest='seed', type=int, default=0),
+        Option('-b', '--batch-size', dest='batch_size', type=int,
+               default=GENERATE_BATCH_SIZE),
+    )
+
+    def run(self, actors, movies, careers, seed, batch_size):
+        generate_dataset(actors, movies, careers, seed, batch_size)
+
+
+manager.add_command('import', Import())
+manager.add_command('generate', Generate())
+
+
 @manager.command
 def seed_base():
     "Add seed data to the database"
@@ -28,22 +75,18 @@ def seed_base():
     objects = [actor1, actor2, actor3, movie1, movie2, movie3]
 
     db.session.bulk_save_objects(objects)
+    bump_versions(Actor.__tablename__, Movie.__tablename__)
     db.session.commit()
 
 
 @manager.command
 def seed_relationship():
 
-    career_model11 = CareerModel(1, 1)
-    career_model12 = CareerModel(1, 2)
-    career_model13 = CareerModel(1, 3)
-    career_model21 = CareerModel(2, 1)
-    career_model31 = CareerModel(3, 1)
-
-    objects = [career_model11, career_model12, career_model13,
-               career_model21, career_model31]
+    links = [(1, 1), (1, 2), (1, 3), (2, 1), (3, 1)]
 
-    db.session.bulk_save_objects(objects)
+    # links seeded by a previous run are skipped by the insert itself
+    insert_careers([{'actor_id': actor_id, 'movie_id': movie_id}
+                    for actor_id, movie_id in links])
     db.session.commit()
 
 
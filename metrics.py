@@ -0,0 +1,124 @@
+import os
+import time
+from flask import request, g, current_app
+from prometheus_client import Histogram, Counter, Gauge
+from prometheus_client import CollectorRegistry, REGISTRY
+from prometheus_client import generate_latest, multiprocess
+from prometheus_client import CONTENT_TYPE_LATEST
+
+# set by gunicorn.conf.py; every worker then writes its samples to files in
+# this directory and /metrics sums them, whichever worker serves the scrape
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_LATENCY = Histogram(
+    'capstone_request_duration_seconds',
+    'Time from routing to the response headers',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS)
+REQUEST_DB_TIME = Histogram(
+    'capstone_request_db_seconds',
+    'Time spent executing SQL per request',
+    ['method', 'route'], buckets=LATENCY_BUCKETS)
+REQUEST_QUERIES = Histogram(
+    'capstone_request_queries',
+    'SQL statements executed per request',
+    ['method', 'route'], buckets=QUERY_BUCKETS)
+RESPONSE_SIZE = Histogram(
+    'capstone_response_size_bytes',
+    'Response body size, streamed responses excluded',
+    ['method', 'route'], buckets=SIZE_BUCKETS)
+TOKEN_VERIFY_TIME = Histogram(
+    'capstone_token_verify_seconds',
+    'Time to obtain a verified token payload',
+    ['cache'], buckets=LATENCY_BUCKETS)
+JWKS_FETCH_TIME = Histogram(
+    'capstone_jwks_fetch_seconds',
+    'Time to download the Auth0 key set',
+    ['outcome'], buckets=LATENCY_BUCKETS)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'capstone_admission_queue_depth',
+    'Requests waiting for admission',
+    ['route_class'], multiprocess_mode='livesum')
+ADMISSION_IN_FLIGHT = Gauge(
+    'capstone_admission_in_flight',
+    'Requests admitted and not yet finished',
+    ['route_class'], multiprocess_mode='livesum')
+ADMISSION_REJECTED = Counter(
+    'capstone_admission_rejected_total',
+    'Requests turned away by admission control',
+    ['route_class', 'reason'])
+DB_POOL_IN_USE = Gauge(
+    'capstone_db_pool_in_use',
+    'Database connections checked out of the pool',
+    multiprocess_mode='livesum')
+DB_POOL_WAITING = Gauge(
+    'capstone_db_pool_waiting',
+    'Callers blocked on a connection checkout',
+    multiprocess_mode='livesum')
+DB_POOL_WAIT_TIME = Histogram(
+    'capstone_db_pool_wait_seconds',
+    'Time to check a connection out of the pool',
+    ['outcome'], buckets=LATENCY_BUCKETS)
+RESPONSE_CACHE_LOOKUPS = Counter(
+    'capstone_response_cache_lookups_total',
+    'Response cache lookups by outcome',
+    ['outcome'])
+
+# label lookups take a lock inside prometheus_client, so the children are
+# resolved once and then read from a plain dict
+_children = {}
+
+
+def observe(metric, value, *labels):
+    child = _children.get((metric, labels))
+    if child is None:
+        child = _children[(metric, labels)] = metric.labels(*labels)
+
+    child.observe(value)
+
+
+def route_label():
+    'The url rule, not the path, so ids do not explode the label set'
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def record_request(response):
+    started = g.get('started', None)
+    if started is None:
+        return response
+
+    route = route_label()
+    observe(REQUEST_LATENCY, time.perf_counter() - started,
+            request.method, route, str(response.status_code))
+    observe(REQUEST_DB_TIME, g.db_seconds, request.method, route)
+    observe(REQUEST_QUERIES, g.db_queries, request.method, route)
+    if not response.is_streamed:
+        observe(RESPONSE_SIZE, response.content_length or 0,
+                request.method, route)
+
+    return response
+
+
+def init_metrics(app):
+    '''
+    init_metrics(app)
+        records request latency, size and SQL time for every request the
+        app serves; the SQL time is measured by query_log
+    '''
+    app.after_request(record_request)
+
+
+def metrics_response():
+    'Every metric in the Prometheus text format'
+    registry = REGISTRY
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, MULTIPROC_DIR)
+
+    return current_app.response_class(generate_latest(registry),
+                                      content_type=CONTENT_TYPE_LATEST)
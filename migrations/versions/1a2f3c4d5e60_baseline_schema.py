@@ -0,0 +1,71 @@
+"""baseline schema
+
+Tables were created by db.create_all() before migrations were tracked, so
+each table is only created when it is missing.
+
+Revision ID: 1a2f3c4d5e60
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a2f3c4d5e60'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'TableVersion' not in tables:
+        op.create_table(
+            'TableVersion',
+            sa.Column('table_name', sa.String(), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('table_name')
+        )
+
+    if 'Actor' not in tables:
+        op.create_table(
+            'Actor',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('age', sa.Integer(), nullable=False),
+            sa.Column('gender', sa.Enum('male', 'female', 'non-binary',
+                                        name='gender_types'), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'Movie' not in tables:
+        op.create_table(
+            'Movie',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(), nullable=False),
+            sa.Column('release_date', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'Career' not in tables:
+        op.create_table(
+            'Career',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('actor_id', sa.Integer(), nullable=True),
+            sa.Column('movie_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['actor_id'], ['Actor.id']),
+            sa.ForeignKeyConstraint(['movie_id'], ['Movie.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('Career')
+    op.drop_table('Movie')
+    op.drop_table('Actor')
+    op.drop_table('TableVersion')
+    sa.Enum(name='gender_types').drop(op.get_bind(), checkfirst=True)
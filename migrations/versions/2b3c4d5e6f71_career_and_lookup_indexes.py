@@ -0,0 +1,51 @@
+"""career and lookup indexes
+
+Makes (actor_id, movie_id) unique on Career, adds the reverse
+(movie_id, actor_id) index for cast lookups and cascades, and indexes the
+Actor.name, Movie.title and Movie.release_date lookup columns. Duplicate
+career links are removed first, keeping the oldest row.
+
+Revision ID: 2b3c4d5e6f71
+Revises: 1a2f3c4d5e60
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b3c4d5e6f71'
+down_revision = '1a2f3c4d5e60'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_Career_actor_id_movie_id', 'Career', ['actor_id', 'movie_id'], True),
+    ('ix_Career_movie_id_actor_id', 'Career', ['movie_id', 'actor_id'], False),
+    ('ix_Actor_name', 'Actor', ['name'], False),
+    ('ix_Movie_title', 'Movie', ['title'], False),
+    ('ix_Movie_release_date', 'Movie', ['release_date'], False),
+]
+
+
+def existing_indexes(table_name):
+    inspector = sa.inspect(op.get_bind())
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def upgrade():
+    op.execute(
+        'DELETE FROM "Career" WHERE id NOT IN '
+        '(SELECT MIN(id) FROM "Career" GROUP BY actor_id, movie_id)'
+    )
+
+    for name, table_name, columns, unique in INDEXES:
+        # db.create_all() may already have built them on a fresh database
+        if name not in existing_indexes(table_name):
+            op.create_index(name, table_name, columns, unique=unique)
+
+
+def downgrade():
+    for name, table_name, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table_name)
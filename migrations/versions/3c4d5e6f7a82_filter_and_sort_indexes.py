@@ -0,0 +1,48 @@
+"""filter and sort indexes
+
+Indexes Actor.age for range filters and sorting, and adds
+varchar_pattern_ops indexes so PostgreSQL can answer the name and title
+prefix filters (LIKE 'prefix%') with an index range scan whatever the
+database collation.
+
+Revision ID: 3c4d5e6f7a82
+Revises: 2b3c4d5e6f71
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c4d5e6f7a82'
+down_revision = '2b3c4d5e6f71'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_Actor_age', 'Actor', 'age', None),
+    ('ix_Actor_name_pattern', 'Actor', 'name', 'varchar_pattern_ops'),
+    ('ix_Movie_title_pattern', 'Movie', 'title', 'varchar_pattern_ops'),
+]
+
+
+def existing_indexes(table_name):
+    inspector = sa.inspect(op.get_bind())
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def upgrade():
+    for name, table_name, column, ops in INDEXES:
+        # db.create_all() may already have built them on a fresh database
+        if name in existing_indexes(table_name):
+            continue
+
+        postgresql_ops = {column: ops} if ops else {}
+        op.create_index(name, table_name, [column],
+                        postgresql_ops=postgresql_ops)
+
+
+def downgrade():
+    for name, table_name, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table_name)
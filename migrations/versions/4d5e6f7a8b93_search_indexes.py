@@ -0,0 +1,45 @@
+"""search indexes
+
+Full-text (tsvector) and trigram GIN indexes for GET /search on
+PostgreSQL. Expression indexes follow every write, COPY included. SQLite
+builds its FTS5 tables at startup instead, see models.create_search_index.
+
+Revision ID: 4d5e6f7a8b93
+Revises: 3c4d5e6f7a82
+Create Date: 2026-10-18 13:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d5e6f7a8b93'
+down_revision = '3c4d5e6f7a82'
+branch_labels = None
+depends_on = None
+
+SEARCH_COLUMNS = [('Actor', 'name'), ('Movie', 'title')]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in SEARCH_COLUMNS:
+        op.execute(
+            f'CREATE INDEX IF NOT EXISTS "ix_{table}_{column}_tsv" '
+            f'ON "{table}" USING gin (to_tsvector(\'simple\', {column}))')
+        op.execute(
+            f'CREATE INDEX IF NOT EXISTS "ix_{table}_{column}_trgm" '
+            f'ON "{table}" USING gin ({column} gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table, column in SEARCH_COLUMNS:
+        op.execute(f'DROP INDEX IF EXISTS "ix_{table}_{column}_trgm"')
+        op.execute(f'DROP INDEX IF EXISTS "ix_{table}_{column}_tsv"')
@@ -0,0 +1,70 @@
+"""career on delete cascade
+
+Recreates the Career foreign keys with ON DELETE CASCADE, so deleting an
+actor or a movie removes its Career rows in the database instead of the
+ORM loading and deleting them one by one. SQLite cannot alter a
+constraint, so there the table is rebuilt in batch mode.
+
+Revision ID: 5e6f7a8b9ca4
+Revises: 4d5e6f7a8b93
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e6f7a8b9ca4'
+down_revision = '4d5e6f7a8b93'
+branch_labels = None
+depends_on = None
+
+# gives the unnamed SQLite constraints a name batch mode can drop
+NAMING_CONVENTION = {
+    'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'
+}
+
+
+def set_on_delete(ondelete):
+    bind = op.get_bind()
+    foreign_keys = [
+        foreign_key
+        for foreign_key in sa.inspect(bind).get_foreign_keys('Career')
+        # db.create_all() may already have built them on a fresh database
+        if foreign_key['options'].get('ondelete') != ondelete
+    ]
+    if not foreign_keys:
+        return
+
+    if bind.dialect.name == 'sqlite':
+        with op.batch_alter_table(
+                'Career', naming_convention=NAMING_CONVENTION,
+                recreate='always') as batch_op:
+            for foreign_key in foreign_keys:
+                name = NAMING_CONVENTION['fk'] % {
+                    'table_name': 'Career',
+                    'column_0_name': foreign_key['constrained_columns'][0],
+                    'referred_table_name': foreign_key['referred_table']
+                }
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(
+                    name, foreign_key['referred_table'],
+                    foreign_key['constrained_columns'],
+                    foreign_key['referred_columns'], ondelete=ondelete)
+        return
+
+    for foreign_key in foreign_keys:
+        op.drop_constraint(foreign_key['name'], 'Career', type_='foreignkey')
+        op.create_foreign_key(
+            foreign_key['name'], 'Career', foreign_key['referred_table'],
+            foreign_key['constrained_columns'],
+            foreign_key['referred_columns'], ondelete=ondelete)
+
+
+def upgrade():
+    set_on_delete('CASCADE')
+
+
+def downgrade():
+    set_on_delete(None)
@@ -0,0 +1,38 @@
+"""import checkpoint
+
+Adds the ImportCheckpoint table. `manage.py import` records its progress
+there in the same transaction as each batch, instead of in a file written
+after the commit, so a crash can no longer load a batch twice on resume.
+
+Revision ID: 6f7a8b9cadb5
+Revises: 5e6f7a8b9ca4
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f7a8b9cadb5'
+down_revision = '5e6f7a8b9ca4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() may already have built it on a fresh database
+    if 'ImportCheckpoint' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'ImportCheckpoint',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('records', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('ImportCheckpoint')
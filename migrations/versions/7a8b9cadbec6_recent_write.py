@@ -0,0 +1,37 @@
+"""recent write
+
+Adds the RecentWrite table. After a write, replicas.py records there
+until when the token subject must read from the primary, so clients that
+do not keep the sticky cookie still read their own writes.
+
+Revision ID: 7a8b9cadbec6
+Revises: 6f7a8b9cadb5
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a8b9cadbec6'
+down_revision = '6f7a8b9cadb5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() may already have built it on a fresh database
+    if 'RecentWrite' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'RecentWrite',
+        sa.Column('subject', sa.String(), nullable=False),
+        sa.Column('until', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('subject')
+    )
+
+
+def downgrade():
+    op.drop_table('RecentWrite')
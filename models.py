@@ -1,26 +1,337 @@
-from flask_sqlalchemy import SQLAlchemy
+import sqlite3
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm, event
+from sqlalchemy.engine import Engine
 from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum
+from sqlalchemy import update, text, and_
+from sqlalchemy.dialects import postgresql
 from datetime import datetime
 from environs import Env
+from db_pool import engine_options, pool_monitor
 
 env = Env()
 env.read_env()
 
-db = SQLAlchemy()
+
+class RoutingSession(SignallingSession):
+    '''RoutingSession(db, **options)
+        Sends the reads of a session to the replica bind named in
+        `session.info['replica']`. Flushes, and every session without a
+        replica, stay on the primary.
+    '''
+
+    def get_bind(self, mapper=None, clause=None):
+        replica = self.info.get('replica')
+        if replica is not None and not self._flushing:
+            return db.get_engine(self.app, bind=replica)
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
 
 DATABASE_PATH = env.str('DATABASE_URL')
+# comma separated read replicas of DATABASE_URL
+REPLICA_PATHS = env.list('DATABASE_REPLICA_URLS', [])
+
+BULK_BATCH_SIZE = 1000
+
 
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    'SQLite only enforces foreign keys, and so ON DELETE CASCADE, when asked'
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
-def setup_db(app, database_path=DATABASE_PATH):
+
+event.listen(Engine, 'connect', enable_sqlite_foreign_keys)
+
+
+def replica_binds(app):
+    'Bind keys of the replicas configured for app'
+    return [key for key in app.config.get('SQLALCHEMY_BINDS') or {}
+            if key.startswith('replica')]
+
+
+def all_engines(app):
+    'The primary engine of app followed by one engine per replica'
+    return [db.get_engine(app)] + [db.get_engine(app, bind=bind)
+                                   for bind in replica_binds(app)]
+
+
+def setup_db(app, database_path=DATABASE_PATH, replica_paths=REPLICA_PATHS):
     '''
-    setup_db(app)
-        binds a flask application and a SQLAlchemy service
+    setup_db(app, database_path, replica_paths)
+        binds a flask application and a SQLAlchemy service. Replicas are
+        only read from, by handlers wrapped in replicas.read_replica.
     '''
     app.config['SQLALCHEMY_DATABASE_URI'] = database_path
+    app.config['SQLALCHEMY_BINDS'] = {
+        f'replica{i}': replica_path
+        for i, replica_path in enumerate(replica_paths)
+    }
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_path)
     db.app = app
     db.init_app(app)
-    db.create_all()
+    for engine in all_engines(app):
+        pool_monitor.attach(engine)
+    db.create_all(bind=None)
+    with db.engine.begin() as connection:
+        create_search_index(connection)
+
+
+SEARCH_TABLES = (('Actor', 'name'), ('Movie', 'title'))
+
+
+def sqlite_search_ddl(table, column):
+    'FTS5 index over an existing table, kept in sync by triggers'
+    search_table = f'{table}Search'
+    return [
+        f'CREATE VIRTUAL TABLE "{search_table}" USING '
+        f"fts5({column}, content='{table}', content_rowid='id')",
+        f'CREATE TRIGGER "{search_table}_ai" AFTER INSERT ON "{table}" BEGIN '
+        f'INSERT INTO "{search_table}"(rowid, {column}) '
+        f'VALUES (new.id, new.{column}); END',
+        f'CREATE TRIGGER "{search_table}_ad" AFTER DELETE ON "{table}" BEGIN '
+        f'INSERT INTO "{search_table}"("{search_table}", rowid, {column}) '
+        f"VALUES ('delete', old.id, old.{column}); END",
+        f'CREATE TRIGGER "{search_table}_au" AFTER UPDATE ON "{table}" BEGIN '
+        f'INSERT INTO "{search_table}"("{search_table}", rowid, {column}) '
+        f"VALUES ('delete', old.id, old.{column}); "
+        f'INSERT INTO "{search_table}"(rowid, {column}) '
+        f'VALUES (new.id, new.{column}); END',
+        f'INSERT INTO "{search_table}"("{search_table}") VALUES (\'rebuild\')',
+    ]
+
+
+def is_search_object(name):
+    '''
+    is_search_object(name)
+        search indexes live outside the model metadata, built by migration
+        4d5e6f7a8b93 on PostgreSQL and by create_search_index on SQLite,
+        so schema comparisons must skip them
+    '''
+    return bool(name) and (
+        name.startswith(tuple(f'{table}Search' for table, _ in SEARCH_TABLES))
+        or name.endswith(('_tsv', '_trgm'))
+    )
+
+
+def create_search_index(connection):
+    '''
+    create_search_index(connection)
+        builds the SQLite FTS5 search tables if they are missing; they stay
+        in sync with every write path through triggers. PostgreSQL gets its
+        indexes from migration 4d5e6f7a8b93 only, since building them needs
+        extension privileges and would lock the tables at every boot.
+    '''
+    if connection.dialect.name != 'sqlite':
+        return
+
+    for table, column in SEARCH_TABLES:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+            {'name': f'{table}Search'}
+        ).scalar()
+        if not exists:
+            for ddl in sqlite_search_ddl(table, column):
+                connection.execute(text(ddl))
+
+
+class TableVersion(db.Model):
+    '''
+    TableVersion class/table
+    Change counter per table, bumped in the same transaction as each write
+    so every worker can tell whether a cached response is still current
+    '''
+    __tablename__ = 'TableVersion'
+
+    table_name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<TableVersion {self.table_name}, {self.version}>'
+
+
+class ImportCheckpoint(db.Model):
+    '''
+    ImportCheckpoint class/table
+    Input records an import has committed, written in the same transaction
+    as the rows they count so a resumed import never loads a batch twice
+    '''
+    __tablename__ = 'ImportCheckpoint'
+
+    name = Column(String, primary_key=True)
+    records = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ImportCheckpoint {self.name}, {self.records}>'
+
+
+class RecentWrite(db.Model):
+    '''
+    RecentWrite class/table
+    Until when each token subject reads from the primary after a write, so
+    read-your-writes also holds for clients that drop cookies
+    '''
+    __tablename__ = 'RecentWrite'
+
+    subject = Column(String, primary_key=True)
+    until = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<RecentWrite {self.subject}, {self.until}>'
+
+
+def bump_versions(*table_names):
+    '''
+    bump_versions(*table_names)
+        marks tables as changed; committed with the caller's transaction
+    '''
+    now = datetime.utcnow()
+    table = TableVersion.__table__
+    for table_name in table_names:
+        # a single statement each, so two first writes to a table cannot
+        # both insert its row
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(
+                postgresql.insert(table)
+                .values(table_name=table_name, version=1, updated_at=now)
+                .on_conflict_do_update(
+                    index_elements=['table_name'],
+                    set_={'version': table.c.version + 1, 'updated_at': now})
+            )
+            continue
+
+        db.session.execute(
+            table.insert().prefix_with('OR IGNORE'),
+            {'table_name': table_name, 'version': 0, 'updated_at': now})
+        db.session.execute(
+            update(table)
+            .where(table.c.table_name == table_name)
+            .values(version=table.c.version + 1, updated_at=now)
+        )
+
+
+def get_versions(*table_names):
+    '''
+    get_versions(*table_names)
+        returns {table_name: (version, updated_at)}; tables that were
+        never written to have version 0
+    '''
+    rows = db.session.query(
+        TableVersion.table_name,
+        TableVersion.version,
+        TableVersion.updated_at
+    ).filter(TableVersion.table_name.in_(table_names)).all()
+
+    versions = {table_name: (0, None) for table_name in table_names}
+    versions.update({row[0]: (row[1], row[2]) for row in rows})
+    return versions
+
+
+def reserve_ids(model, count):
+    '''
+    reserve_ids(model, count)
+        draws `count` ids from the PostgreSQL serial sequence of `model`
+        in one round trip
+    '''
+    result = db.session.execute(
+        text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+             "FROM generate_series(1, :count)"),
+        {'table': f'"{model.__tablename__}"', 'count': count}
+    )
+    return [row[0] for row in result]
+
+
+def bulk_insert(model, rows, batch_size=BULK_BATCH_SIZE):
+    '''
+    bulk_insert(model, rows)
+        inserts rows in batches within the current transaction and
+        returns their ids in order; the caller commits
+    '''
+    if not rows:
+        return []
+
+    if db.engine.dialect.name == 'postgresql':
+        ids = reserve_ids(model, len(rows))
+        rows = [dict(row, id=id) for row, id in zip(rows, ids)]
+        for start in range(0, len(rows), batch_size):
+            db.session.execute(
+                model.__table__.insert(), rows[start:start + batch_size])
+        return ids
+
+    # without sequences, let the ORM fetch each generated id
+    rows = [dict(row) for row in rows]
+    for start in range(0, len(rows), batch_size):
+        db.session.bulk_insert_mappings(
+            model, rows[start:start + batch_size], return_defaults=True)
+    return [row['id'] for row in rows]
+
+
+def insert_careers(rows, batch_size=BULK_BATCH_SIZE):
+    '''
+    insert_careers(rows)
+        inserts {actor_id, movie_id} rows in batches, skipping pairs that
+        are already linked, within the current transaction. Returns the
+        number of rows inserted.
+    '''
+    if not rows:
+        return 0
+
+    table = CareerModel.__table__
+    if db.engine.dialect.name == 'postgresql':
+        statement = postgresql.insert(table).on_conflict_do_nothing(
+            index_elements=['actor_id', 'movie_id'])
+    else:
+        statement = table.insert().prefix_with('OR IGNORE')
+
+    inserted = 0
+    for start in range(0, len(rows), batch_size):
+        inserted += db.session.execute(
+            statement, rows[start:start + batch_size]).rowcount
+    bump_versions(CareerModel.__tablename__)
+    return inserted
+
+
+def delete_careers(owner_column, owner_id, related_column, ids):
+    '''
+    delete_careers(owner_column, owner_id, related_column, ids)
+        unlinks `ids` from one actor or movie in a single statement and
+        returns the number of links removed
+    '''
+    result = db.session.execute(CareerModel.__table__.delete().where(
+        and_(owner_column == owner_id, related_column.in_(ids))))
+    if result.rowcount:
+        bump_versions(CareerModel.__tablename__)
+
+    return result.rowcount
+
+
+def bulk_delete(model, ids):
+    '''
+    bulk_delete(model, ids)
+        deletes the rows with the given ids in two statements, whatever
+        their number, and returns the ids that existed. Dependent Career
+        rows go with them through ON DELETE CASCADE; the caller commits.
+    '''
+    found = [row[0] for row in db.session.query(model.id)
+             .filter(model.id.in_(ids)).all()]
+    if found:
+        model.query.filter(model.id.in_(found)).delete(
+            synchronize_session=False)
+        bump_versions(model.__tablename__, CareerModel.__tablename__)
+
+    return found
 
 
 class Actor(db.Model):
@@ -28,13 +339,23 @@ class Actor(db.Model):
     Actor class/table
     '''
     __tablename__ = 'Actor'
+    __table_args__ = (
+        # lets PostgreSQL serve LIKE 'prefix%' from an index
+        db.Index('ix_Actor_name_pattern', 'name',
+                 postgresql_ops={'name': 'varchar_pattern_ops'}),
+    )
 
     id = Column(Integer, primary_key=True)
-    name = Column(String, nullable=False)
-    age = Column(Integer, nullable=False)
+    name = Column(String, nullable=False, index=True)
+    age = Column(Integer, nullable=False, index=True)
     gender = Column(Enum('male', 'female', 'non-binary', name='gender_types'))
 
-    movies = db.relationship('Movie', secondary='Career')
+    # Career rows are removed by ON DELETE CASCADE, not loaded and deleted
+    movies = db.relationship('Movie', secondary='Career',
+                             passive_deletes=True)
+
+    # columns a client may select with ?fields=
+    FIELDS = ('id', 'name', 'age', 'gender')
 
     def __init__(self, name, age, gender):
         self.name = name
@@ -43,22 +364,32 @@ class Actor(db.Model):
 
     def insert(self):
         db.session.add(self)
+        bump_versions(self.__tablename__)
         db.session.commit()
 
     def update(self):
+        bump_versions(self.__tablename__)
         db.session.commit()
 
     def delete(self):
         db.session.delete(self)
+        bump_versions(self.__tablename__, CareerModel.__tablename__)
         db.session.commit()
 
-    def format(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'age': self.age,
-            'gender': self.gender or 'non-binary'
-        }
+    def format(self, fields=None):
+        if fields is None:
+            return {
+                'id': self.id,
+                'name': self.name,
+                'age': self.age,
+                'gender': self.gender or 'non-binary'
+            }
+
+        formatted = {field: getattr(self, field) for field in fields}
+        if 'gender' in formatted:
+            formatted['gender'] = formatted['gender'] or 'non-binary'
+
+        return formatted
 
     def __repr__(self):
         return f'<Actor {self.name}, {self.gender or "non-binary"}>'
@@ -69,12 +400,20 @@ class Movie(db.Model):
     Movie class/table
     '''
     __tablename__ = 'Movie'
+    __table_args__ = (
+        db.Index('ix_Movie_title_pattern', 'title',
+                 postgresql_ops={'title': 'varchar_pattern_ops'}),
+    )
 
     id = Column(Integer, primary_key=True)
-    title = Column(String, nullable=False)
-    release_date = Column(DateTime, nullable=False, default=datetime.utcnow())
+    title = Column(String, nullable=False, index=True)
+    release_date = Column(DateTime, nullable=False, default=datetime.utcnow(),
+                          index=True)
 
-    actors = db.relationship('Actor', secondary='Career')
+    actors = db.relationship('Actor', secondary='Career',
+                             passive_deletes=True)
+
+    FIELDS = ('id', 'title', 'release_date')
 
     def __init__(self, title, release_date):
         self.title = title
@@ -82,21 +421,27 @@ class Movie(db.Model):
 
     def insert(self):
         db.session.add(self)
+        bump_versions(self.__tablename__)
         db.session.commit()
 
     def update(self):
+        bump_versions(self.__tablename__)
         db.session.commit()
 
     def delete(self):
         db.session.delete(self)
+        bump_versions(self.__tablename__, CareerModel.__tablename__)
         db.session.commit()
 
-    def format(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'release_date': self.release_date
-        }
+    def format(self, fields=None):
+        if fields is None:
+            return {
+                'id': self.id,
+                'title': self.title,
+                'release_date': self.release_date
+            }
+
+        return {field: getattr(self, field) for field in fields}
 
     def __repr__(self):
         return f'<Movie {self.id}, {self.title}>'
@@ -108,15 +453,20 @@ class CareerModel(db.Model):
     '''
 
     __tablename__ = 'Career'
+    __table_args__ = (
+        db.Index('ix_Career_actor_id_movie_id', 'actor_id', 'movie_id',
+                 unique=True),
+        db.Index('ix_Career_movie_id_actor_id', 'movie_id', 'actor_id'),
+    )
 
     id = Column(Integer, primary_key=True)
-    actor_id = Column(Integer, ForeignKey('Actor.id'))
-    movie_id = Column(Integer, ForeignKey('Movie.id'))
+    actor_id = Column(Integer, ForeignKey('Actor.id', ondelete='CASCADE'))
+    movie_id = Column(Integer, ForeignKey('Movie.id', ondelete='CASCADE'))
 
     actor = db.relationship(Actor, backref=db.backref(
-        'career', cascade='all, delete-orphan'))
+        'career', cascade='all, delete-orphan', passive_deletes=True))
     movie = db.relationship(Movie, backref=db.backref(
-        'career', cascade='all, delete-orphan'))
+        'career', cascade='all, delete-orphan', passive_deletes=True))
 
     def __init__(self, actor_id, movie_id):
         self.actor_id = actor_id
@@ -124,13 +474,16 @@ class CareerModel(db.Model):
 
     def insert(self):
         db.session.add(self)
+        bump_versions(self.__tablename__)
         db.session.commit()
 
     def update(self):
+        bump_versions(self.__tablename__)
         db.session.commit()
 
     def delete(self):
         db.session.delete(self)
+        bump_versions(self.__tablename__)
         db.session.commit()
 
     def __repr__(self):
@@ -1,12 +1,168 @@
-from flask import request
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import namedtuple
+from datetime import datetime
+from flask import request, abort
+from sqlalchemy import and_, or_, DateTime
 
 ITEMS_PER_PAGE = 10
+MAX_ITEMS_PER_PAGE = 100
 
+Page = namedtuple('Page', ['items', 'total', 'next_cursor'])
 
-def paginate_results(results):
-    'Paginate list of results'
-    page = request.args.get('page', 1, int)
-    start = (page - 1) * ITEMS_PER_PAGE
-    end = start + ITEMS_PER_PAGE
 
-    return results[start:end]
+def clamp_page_size(size):
+    return min(max(size, 1), MAX_ITEMS_PER_PAGE)
+
+
+def get_page_args():
+    'Read ?page= and ?per_page=, capped server-side'
+    page = max(request.args.get('page', 1, int), 1)
+    per_page = clamp_page_size(
+        request.args.get('per_page', ITEMS_PER_PAGE, int))
+
+    return page, per_page
+
+
+def wants_count():
+    'Clients may skip the COUNT query with ?count=false'
+    return request.args.get('count', 'true').lower() not in ('false', '0')
+
+
+def is_keyset_request():
+    'Cursor mode is selected with ?after=<cursor> and/or ?limit=N'
+    return 'after' in request.args or 'limit' in request.args
+
+
+def get_sort_order(sort_keys, tiebreaker):
+    '''
+    get_sort_order(sort_keys, tiebreaker)
+        parses ?sort=key,-key against a whitelist of sortable columns and
+        returns a list of (column, descending) pairs ending with the
+        unique tiebreaker column
+    '''
+    order = []
+    for name in request.args.get('sort', '').split(','):
+        name = name.strip()
+        if not name:
+            continue
+
+        column = sort_keys.get(name.lstrip('-'))
+        if column is None:
+            abort(400, f'cannot sort by {name.lstrip("-")}')
+
+        order.append((column, name.startswith('-')))
+
+    if tiebreaker.key not in [column.key for column, _ in order]:
+        order.append((tiebreaker, False))
+
+    return order
+
+
+def order_clauses(order):
+    return [column.desc() if desc else column.asc() for column, desc in order]
+
+
+def encode_cursor(values):
+    'Opaque, url-safe encoding of the sort values of the last row'
+    values = [v.isoformat() if isinstance(v, datetime) else v
+              for v in values]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def cursor_value(column, value):
+    '''
+    cursor_value(column, value)
+        converts a decoded cursor value to the python type of `column`;
+        raises ValueError when it cannot be bound against that column
+    '''
+    if value is None:
+        return None
+
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+
+    python_type = column.type.python_type
+    if isinstance(value, bool) or not isinstance(value, python_type):
+        raise ValueError(value)
+
+    return value
+
+
+def decode_cursor(cursor, order):
+    try:
+        raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(order):
+            raise ValueError(cursor)
+
+        return [cursor_value(column, value)
+                for (column, _), value in zip(order, values)]
+
+    except (ValueError, TypeError):
+        abort(400, 'invalid cursor')
+
+
+def keyset_filter(order, values):
+    '''
+    keyset_filter(order, values)
+        rows strictly after `values` in `order`, i.e.
+        (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+    '''
+    clauses = []
+    for i, (column, desc) in enumerate(order):
+        equal = [c == v for (c, _), v in zip(order[:i], values[:i])]
+        after = column < values[i] if desc else column > values[i]
+        clauses.append(and_(*equal, after))
+
+    return or_(*clauses)
+
+
+def paginate_keyset(query, order):
+    '''
+    paginate_keyset(query, order)
+        fetches the page after ?after=<cursor>; the cost does not depend
+        on how deep the client has scrolled
+    '''
+    limit = clamp_page_size(request.args.get('limit', ITEMS_PER_PAGE, int))
+    after = request.args.get('after')
+
+    if after:
+        query = query.filter(keyset_filter(order, decode_cursor(after, order)))
+
+    items = query.order_by(*order_clauses(order)).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        next_cursor = encode_cursor(
+            [getattr(items[-1], column.key) for column, _ in order])
+
+    return Page(items, None, next_cursor)
+
+
+def paginate_query(query, order):
+    '''
+    paginate_query(query, order)
+        fetches ?page=N with LIMIT/OFFSET and counts the full result set
+        with a separate COUNT unless ?count=false
+    '''
+    page, per_page = get_page_args()
+
+    items = (query.order_by(*order_clauses(order))
+             .limit(per_page).offset((page - 1) * per_page).all())
+
+    total = None
+    if wants_count():
+        total = query.order_by(None).count()
+
+    return Page(items, total, None)
+
+
+def paginate(query, order):
+    'Dispatch to cursor or page pagination from the query string'
+    if is_keyset_request():
+        return paginate_keyset(query, order)
+
+    return paginate_query(query, order)
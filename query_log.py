@@ -0,0 +1,101 @@
+import logging
+import re
+import time
+from flask import request, g, has_app_context, has_request_context
+from sqlalchemy import event
+from environs import Env
+
+env = Env()
+env.read_env()
+
+# adds a Server-Timing header with the SQL count and time of each request
+SERVER_TIMING = env.bool('SERVER_TIMING', False)
+# statements slower than this are logged, 0 turns the log off
+SLOW_QUERY_MS = env.float('SLOW_QUERY_MS', 200)
+
+slow_query_log = logging.getLogger('capstone.slow_query')
+
+
+def parameter_shape(parameters, executemany=False):
+    '''
+    parameter_shape(parameters, executemany)
+        the types of the bound parameters, never their values, e.g.
+        {name: str, age: int} or 500 x (str, int)
+    '''
+    if executemany:
+        if not parameters:
+            return '0 x ()'
+        return f'{len(parameters)} x {parameter_shape(parameters[0])}'
+
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}'
+                               for key, value in parameters.items()) + '}'
+
+    if isinstance(parameters, (list, tuple)):
+        return '(' + ', '.join(type(value).__name__
+                               for value in parameters) + ')'
+
+    return type(parameters).__name__
+
+
+def start_request():
+    g.started = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+
+def before_cursor_execute(connection, cursor, statement, parameters,
+                          context, executemany):
+    connection.info['query_started'] = time.perf_counter()
+
+
+def after_cursor_execute(connection, cursor, statement, parameters,
+                         context, executemany):
+    elapsed = time.perf_counter() - connection.info['query_started']
+    if has_app_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        log_slow_query(statement, parameters, executemany, elapsed)
+
+
+def log_slow_query(statement, parameters, executemany, elapsed):
+    route = ''
+    if has_request_context():
+        route = f' in {request.method} {request.path}'
+
+    slow_query_log.warning(
+        'slow query %.1f ms%s: %s params=%s', elapsed * 1000, route,
+        re.sub(r'\s+', ' ', statement).strip(),
+        parameter_shape(parameters, executemany))
+
+
+def add_server_timing(response):
+    if 'db_queries' in g:
+        total = (time.perf_counter() - g.started) * 1000
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={g.db_seconds * 1000:.1f};desc="{g.db_queries} queries"'
+            f', total;dur={total:.1f}')
+
+    return response
+
+
+def init_query_log(app, engines):
+    '''
+    init_query_log(app, engines)
+        counts and times the statements run on any of `engines`, replicas
+        included, during each request, and logs the slow ones
+    '''
+    app.before_request(start_request)
+    if SERVER_TIMING:
+        app.after_request(add_server_timing)
+
+    for engine in engines:
+        if not event.contains(engine, 'before_cursor_execute',
+                              before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute',
+                         before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute',
+                         after_cursor_execute)
@@ -0,0 +1,106 @@
+import random
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, request, g
+from sqlalchemy.dialects import postgresql
+from environs import Env
+from models import db, replica_binds, RecentWrite
+
+env = Env()
+env.read_env()
+
+# after a write, the client reads from the primary for this many seconds.
+# Tracked with a cookie and, for clients that drop cookies, by token subject
+READ_YOUR_WRITES_SECONDS = env.int('READ_YOUR_WRITES_SECONDS', 5)
+STICKY_COOKIE = 'capstone_primary_until'
+WRITE_METHODS = ('POST', 'PATCH', 'PUT', 'DELETE')
+
+
+def has_sticky_cookie():
+    try:
+        until = float(request.cookies.get(STICKY_COOKIE, 0))
+    except ValueError:
+        return False
+
+    return until > time.time()
+
+
+def subject_wrote_recently():
+    'Looked up on the primary, before the request is routed to a replica'
+    subject = g.get('token_subject')
+    if not subject:
+        return False
+
+    until = db.session.query(RecentWrite.until).filter_by(
+        subject=subject).scalar()
+    return until is not None and until > datetime.utcnow()
+
+
+def is_sticky():
+    'True while the client is inside its read-your-writes window'
+    return has_sticky_cookie() or subject_wrote_recently()
+
+
+def read_replica(f):
+    '''
+    read_replica(f)
+        decorator for read-only handlers: the request reads from a random
+        replica, unless none is configured or the client wrote recently.
+        Place it above `conditional`, so the validators are read from the
+        same database as the rows.
+    '''
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        binds = replica_binds(current_app)
+        if not binds or is_sticky():
+            return f(*args, **kwargs)
+
+        db.session.info['replica'] = random.choice(binds)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            db.session.info.pop('replica', None)
+
+    return wrapper
+
+
+def record_write(subject):
+    'Pins the token subject to the primary, whichever worker it reaches'
+    until = datetime.utcnow() + timedelta(seconds=READ_YOUR_WRITES_SECONDS)
+    table = RecentWrite.__table__
+    if db.engine.dialect.name == 'postgresql':
+        statement = postgresql.insert(table).values(
+            subject=subject, until=until).on_conflict_do_update(
+            index_elements=['subject'], set_={'until': until})
+    else:
+        statement = table.insert().prefix_with('OR REPLACE').values(
+            subject=subject, until=until)
+
+    try:
+        db.session.execute(statement)
+        db.session.commit()
+
+    except Exception as ex:
+        # the write itself succeeded; only its stickiness is lost
+        db.session.rollback()
+        print(ex)
+
+
+def mark_writes(response):
+    'Pins the client to the primary after a successful write'
+    if request.method in WRITE_METHODS and response.status_code < 400:
+        response.set_cookie(STICKY_COOKIE,
+                            str(time.time() + READ_YOUR_WRITES_SECONDS),
+                            max_age=READ_YOUR_WRITES_SECONDS,
+                            httponly=True, samesite='Lax')
+
+        subject = g.get('token_subject')
+        if subject and replica_binds(current_app):
+            record_write(subject)
+
+    return response
+
+
+def init_replicas(app):
+    app.after_request(mark_writes)
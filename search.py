@@ -0,0 +1,86 @@
+import re
+from sqlalchemy import text
+from models import db, Actor, Movie
+
+SEARCH_KINDS = {
+    'actors': ('actor', Actor),
+    'movies': ('movie', Movie),
+}
+
+# tsvector match ranked by ts_rank, or a trigram match (typos) ranked by
+# similarity; each arm is answered by its GIN index
+POSTGRES_MATCHES = {
+    'actor': '''
+        SELECT 'actor' AS kind, id,
+               GREATEST(ts_rank(to_tsvector('simple', name), query),
+                        similarity(name, :q)) AS rank
+        FROM "Actor", plainto_tsquery('simple', :q) AS query
+        WHERE to_tsvector('simple', name) @@ query OR name % :q
+    ''',
+    'movie': '''
+        SELECT 'movie' AS kind, id,
+               GREATEST(ts_rank(to_tsvector('simple', title), query),
+                        similarity(title, :q)) AS rank
+        FROM "Movie", plainto_tsquery('simple', :q) AS query
+        WHERE to_tsvector('simple', title) @@ query OR title % :q
+    ''',
+}
+
+# word-prefix match ranked by bm25 (lower is better, hence the sign)
+SQLITE_MATCHES = {
+    'actor': '''
+        SELECT 'actor' AS kind, rowid AS id, -bm25("ActorSearch") AS rank
+        FROM "ActorSearch" WHERE "ActorSearch" MATCH :q
+    ''',
+    'movie': '''
+        SELECT 'movie' AS kind, rowid AS id, -bm25("MovieSearch") AS rank
+        FROM "MovieSearch" WHERE "MovieSearch" MATCH :q
+    ''',
+}
+
+
+def sqlite_query(q):
+    'Every word of q as a quoted FTS5 prefix term'
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', q))
+
+
+def search(q, kinds, page, per_page, count=True):
+    '''
+    search(q, kinds, page, per_page, count)
+        ranks actors and movies matching q and returns one page of
+        (kind, object, rank) plus the total number of matches, or None
+        for the total when count is False
+    '''
+    if db.engine.dialect.name == 'postgresql':
+        matches = POSTGRES_MATCHES
+    else:
+        matches = SQLITE_MATCHES
+        q = sqlite_query(q)
+        if not q:
+            return [], 0 if count else None
+
+    arms = [matches[SEARCH_KINDS[kind][0]] for kind in kinds]
+    union = ' UNION ALL '.join(arms)
+
+    rows = db.session.execute(
+        text(f'SELECT kind, id, rank FROM ({union}) AS matches '
+             'ORDER BY rank DESC, kind, id LIMIT :limit OFFSET :offset'),
+        {'q': q, 'limit': per_page, 'offset': (page - 1) * per_page}
+    ).fetchall()
+
+    total = None
+    if count:
+        total = db.session.execute(
+            text(f'SELECT COUNT(*) FROM ({union}) AS matches'), {'q': q}
+        ).scalar()
+
+    objects = {}
+    for kind, model in SEARCH_KINDS.values():
+        ids = [row.id for row in rows if row.kind == kind]
+        if ids:
+            for item in model.query.filter(model.id.in_(ids)):
+                objects[(kind, item.id)] = item
+
+    results = [(row.kind, objects[(row.kind, row.id)], row.rank)
+               for row in rows if (row.kind, row.id) in objects]
+    return results, total
@@ -1,10 +1,37 @@
 import os
+import gzip
 import json
+import random
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from unittest import TestCase, main
 from environs import Env
+from flask import Flask, g, request
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate, upgrade
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
 from app import create_app
-from models import Actor, Movie, setup_db
+import time
+from auth import JWKSCache, TokenCache
+from cache import ResponseCache
+from conditional import last_modified
+from db_pool import PoolMonitor, MonitoredQueuePool
+from sqlalchemy import create_engine, event, exc
+from json_provider import JSON_PROVIDERS, init_json_provider, jsonify
+from query_log import init_query_log, parameter_shape
+from pagination import encode_cursor
+from replicas import init_replicas, read_replica
+from admission import ConcurrencyLimiter, TokenBuckets
+from compression import init_compression
+from validation import validate_actor, validate_items
+import importer
+from importer import import_file, read_checkpoint
+from dataset import generate_dataset, generate_careers
+from models import db, Actor, Movie, CareerModel, setup_db, all_engines
+from models import bulk_delete, insert_careers, is_search_object
+from models import bump_versions, get_versions
 from configparser import ConfigParser
 
 env = Env()
@@ -71,6 +98,27 @@ class CapstoneTest(TestCase):
         """Executed after reach test"""
         pass
 
+    @contextmanager
+    def assertMaxQueries(self, count):
+        """Fails if the block runs more than `count` SQL statements"""
+        statements = []
+
+        def record(connection, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'after_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'after_cursor_execute', record)
+
+        self.assertLessEqual(
+            len(statements), count,
+            f'{len(statements)} queries, expected at most {count}:\n'
+            + '\n'.join(statements))
+
     '''
       Test Index Route
     '''
@@ -109,6 +157,45 @@ class CapstoneTest(TestCase):
         self.assertFalse(body.get('success'))
         self.assertIn('error', body.keys())
 
+    def test_post_actors_bulk_201(self):
+        response = self.client().post(
+            '/actors/bulk',
+            json=[self.new_valid_actor, self.new_valid_actor],
+            headers={'Authorization': f'Bearer {CASTING_DIRECTOR_TOKEN}'}
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(body.get('success'))
+        self.assertEqual(body.get('total_created'), 2)
+        self.assertEqual(len(body.get('actors')), 2)
+
+    def test_post_actors_bulk_400_error(self):
+        response = self.client().post(
+            '/actors/bulk',
+            json=[self.new_valid_actor, self.new_invalid_actor],
+            headers={'Authorization': f'Bearer {CASTING_DIRECTOR_TOKEN}'}
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(body.get('success'))
+        self.assertEqual(body.get('errors')[0]['index'], 1)
+
+    def test_post_actors_bulk_invalid_age_400_error(self):
+        response = self.client().post(
+            '/actors/bulk',
+            json=[self.new_valid_actor,
+                  dict(self.new_valid_actor, age=True),
+                  dict(self.new_valid_actor, age=-5)],
+            headers={'Authorization': f'Bearer {CASTING_DIRECTOR_TOKEN}'}
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in body.get('errors')],
+                         [1, 2])
+
     def test_get_all_actors_200(self):
         response = self.client().get(
             '/actors',
@@ -124,6 +211,124 @@ class CapstoneTest(TestCase):
         self.assertIn('actors', body.keys())
         self.assertIsInstance(body.get('actors'), list)
 
+    def test_get_actors_per_page_200(self):
+        response = self.client().get(
+            '/actors?page=1&per_page=1',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body.get('success'))
+        self.assertEqual(len(body.get('actors')), 1)
+        self.assertIn('total_results', body.keys())
+
+    def test_get_actors_without_count_200(self):
+        response = self.client().get(
+            '/actors?count=false',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('total_results', body.keys())
+
+    def test_get_actors_filtered_200(self):
+        response = self.client().get(
+            '/actors?name=name&age_min=30&gender=female&sort=-age,name',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        for actor in body.get('actors'):
+            self.assertTrue(actor['name'].startswith('name'))
+            self.assertGreaterEqual(actor['age'], 30)
+            self.assertEqual(actor['gender'], 'female')
+
+    def test_get_actors_unsortable_key_400_error(self):
+        response = self.client().get(
+            '/actors?sort=gender',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(body.get('success'))
+
+    def test_get_actors_fields_200(self):
+        response = self.client().get(
+            '/actors?fields=id,name',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        for actor in body.get('actors'):
+            self.assertEqual(set(actor.keys()), {'id', 'name'})
+
+    def test_get_actors_unknown_field_400_error(self):
+        response = self.client().get(
+            '/actors?fields=id,salary',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(body.get('success'))
+
+    def test_get_actors_include_movies_200(self):
+        response = self.client().get(
+            '/actors?include=movies',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(body.get('actors')[0].get('movies'), list)
+
+    def test_get_actors_include_movies_query_count(self):
+        # versions, actors, count and one query for every actor's movies
+        with self.assertMaxQueries(4):
+            response = self.client().get(
+                '/actors?per_page=100&include=movies',
+                headers={
+                    'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'
+                }
+            )
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_actor_movies_200(self):
+        response = self.client().get(
+            '/actors/1/movies',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body.get('success'))
+        self.assertIsInstance(body.get('movies'), list)
+
+    def test_get_actor_movies_404_error(self):
+        response = self.client().get(
+            '/actors/9999999/movies',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(body.get('success'))
+
     def test_get_single_actors_200(self):
         response = self.client().get(
             '/actors/1',
@@ -136,6 +341,35 @@ class CapstoneTest(TestCase):
         self.assertIn('actor', body.keys())
         self.assertIsInstance(body.get('actor'), dict)
 
+    def test_export_actors_ndjson_200(self):
+        response = self.client().get(
+            '/actors/export?min_id=1&max_id=1',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        rows = [json.loads(line) for line in response.data.splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual([row['id'] for row in rows], [1])
+
+    def test_get_single_actors_304_not_modified(self):
+        response = self.client().get(
+            '/actors/1',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        etag = response.headers.get('ETag')
+
+        response = self.client().get(
+            '/actors/1',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}',
+                     'If-None-Match': etag}
+
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
     def test_get_single_actors_404_error(self):
         response = self.client().get(
             '/actors/9999999',
@@ -201,6 +435,35 @@ class CapstoneTest(TestCase):
         self.assertFalse(body.get('success'))
         self.assertIn('error', body.keys())
 
+    def test_delete_actors_bulk_200(self):
+        create_response = self.client().post(
+            '/actors/bulk',
+            json=[self.new_valid_actor, self.new_valid_actor],
+            headers={'Authorization': f'Bearer {EXECUTIVE_PRODUCER_TOKEN}'}
+        )
+        ids = [actor['id']
+               for actor in json.loads(create_response.data)['actors']]
+
+        with self.assertMaxQueries(4):
+            response = self.client().delete(
+                f'/actors?ids={ids[0]},{ids[1]},9999999',
+                headers={'Authorization': f'Bearer {CASTING_DIRECTOR_TOKEN}'}
+            )
+
+        body = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body.get('actor_ids'), ids)
+        self.assertEqual(body.get('total_deleted'), 2)
+
+    def test_delete_actors_bulk_400_error(self):
+        response = self.client().delete(
+            '/actors?ids=1,two',
+            headers={'Authorization': f'Bearer {CASTING_DIRECTOR_TOKEN}'}
+        )
+        body = json.loads(response.data)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(body.get('success'))
+
     '''
       Test for Movies
     '''
@@ -228,6 +491,18 @@ class CapstoneTest(TestCase):
         self.assertFalse(body.get('success'))
         self.assertIn('error', body.keys())
 
+    def test_post_movies_bulk_201(self):
+        response = self.client().post(
+            '/movies/bulk',
+            json={'movies': [self.new_valid_movie, self.new_valid_movie]},
+            headers={'Authorization': f'Bearer {EXECUTIVE_PRODUCER_TOKEN}'}
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(body.get('success'))
+        self.assertEqual(body.get('total_created'), 2)
+
     def test_get_all_movies_200(self):
         response = self.client().get(
             '/movies',
@@ -243,6 +518,146 @@ class CapstoneTest(TestCase):
         self.assertIn('movies', body.keys())
         self.assertIsInstance(body.get('movies'), list)
 
+    def test_get_movies_cursor_200(self):
+        response = self.client().get(
+            '/movies?limit=1&sort=-release_date',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(body.get('movies')), 1)
+        self.assertIn('next_cursor', body.keys())
+
+        response = self.client().get(
+            f'/movies?limit=1&sort=-release_date&after={body["next_cursor"]}',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        next_body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(next_body.get('movies'), body.get('movies'))
+
+    def test_get_movies_invalid_cursor_400_error(self):
+        response = self.client().get(
+            '/movies?after=invalid',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(body.get('success'))
+
+    def test_get_movies_mistyped_cursor_400_error(self):
+        response = self.client().get(
+            f'/movies?after={encode_cursor(["x"])}',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(body.get('message'), 'invalid cursor')
+
+    def test_export_movies_csv_200(self):
+        response = self.client().get(
+            '/movies/export?format=csv',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        lines = response.data.decode().splitlines()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertEqual(lines[0], 'id,title,release_date')
+        self.assertGreater(len(lines), 1)
+
+    def test_export_movies_csv_empty_range_200(self):
+        response = self.client().get(
+            '/movies/export?format=csv&min_id=9999999',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        lines = response.data.decode().splitlines()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(lines, ['id,title,release_date'])
+
+    def test_export_movies_invalid_range_400_error(self):
+        response = self.client().get(
+            '/movies/export?format=csv&min_id=abc',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(body.get('message'), 'min_id must be an integer')
+
+    def test_get_movie_actors_200(self):
+        response = self.client().get(
+            '/movies/1/actors',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body.get('success'))
+        self.assertIsInstance(body.get('actors'), list)
+
+    def test_link_and_unlink_movie_actors(self):
+        headers = {'Authorization': f'Bearer {EXECUTIVE_PRODUCER_TOKEN}'}
+        create_response = self.client().post(
+            '/actors/bulk',
+            json=[self.new_valid_actor, self.new_valid_actor],
+            headers=headers
+        )
+        ids = [actor['id']
+               for actor in json.loads(create_response.data)['actors']]
+
+        # movie, existence and links, insert, version
+        with self.assertMaxQueries(5):
+            response = self.client().post('/movies/1/actors', json=ids,
+                                          headers=headers)
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(body.get('actor_ids'), ids)
+
+        response = self.client().delete(
+            f'/movies/1/actors?ids={ids[0]},{ids[1]}', headers=headers)
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body.get('total_unlinked'), 2)
+
+    def test_link_unknown_actors_400_error(self):
+        response = self.client().post(
+            '/movies/1/actors',
+            json={'actor_ids': [9999999]},
+            headers={'Authorization': f'Bearer {EXECUTIVE_PRODUCER_TOKEN}'}
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(body.get('missing'), [9999999])
+
+    def test_link_too_many_actors_400_error(self):
+        response = self.client().post(
+            '/movies/1/actors',
+            json={'actor_ids': list(range(1, 10002))},
+            headers={'Authorization': f'Bearer {EXECUTIVE_PRODUCER_TOKEN}'}
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(body.get('message'),
+                         'at most 10000 actor_ids can be linked at once')
+
     def test_get_single_movies_200(self):
         response = self.client().get(
             '/movies/1',
@@ -255,6 +670,28 @@ class CapstoneTest(TestCase):
         self.assertIn('movie', body.keys())
         self.assertIsInstance(body.get('movie'), dict)
 
+    def test_get_movie_actors_query_count(self):
+        # versions, movie existence, cast and count
+        with self.assertMaxQueries(4):
+            response = self.client().get(
+                '/movies/1/actors',
+                headers={
+                    'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'
+                }
+            )
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_single_movies_fields_200(self):
+        response = self.client().get(
+            '/movies/1?fields=title',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(body.get('movie').keys()), ['title'])
+
     def test_get_single_movies_404_error(self):
         response = self.client().get(
             '/movies/9999999',
@@ -328,6 +765,753 @@ class CapstoneTest(TestCase):
         self.assertFalse(body.get('success'))
         self.assertIn('error', body.keys())
 
+    '''
+      Test for Health
+    '''
+
+    def test_health_200(self):
+        response = self.client().get('/health')
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body.get('success'))
+        self.assertIn('hits', body['caches']['jwks'])
+        self.assertIn('hits', body['caches']['tokens'])
+        self.assertIn('hit_rate', body['caches']['responses'])
+
+    '''
+      Test for Metrics
+    '''
+
+    def test_metrics_200(self):
+        self.client().get(
+            '/actors',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+        )
+        response = self.client().get('/metrics')
+        metrics = response.get_data(as_text=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('capstone_request_duration_seconds_count{'
+                      'method="GET",route="/actors",status="200"}', metrics)
+        self.assertIn('capstone_token_verify_seconds_count', metrics)
+
+    '''
+      Test for Search
+    '''
+
+    def test_search_200(self):
+        response = self.client().get(
+            '/search?q=name1',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body.get('success'))
+        self.assertIsInstance(body.get('results'), list)
+        self.assertIn('total_results', body.keys())
+
+    def test_search_without_query_400_error(self):
+        response = self.client().get(
+            '/search',
+            headers={'Authorization': f'Bearer {CASTING_ASSISTANT_TOKEN}'}
+
+        )
+        body = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(body.get('success'))
+
+
+class StubJWKSCache(JWKSCache):
+    """JWKSCache that serves a fixed key set instead of calling Auth0"""
+
+    def __init__(self, keys, **kwargs):
+        super().__init__(**kwargs)
+        self.stub_keys = keys
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        if self.stub_keys is None:
+            raise OSError('jwks unavailable')
+        return dict(self.stub_keys)
+
+
+class JWKSCacheTest(TestCase):
+    """
+    Class for the JWKS cache test cases
+    """
+
+    def test_key_is_fetched_once(self):
+        cache = StubJWKSCache({'kid1': {'kid': 'kid1'}})
+
+        self.assertEqual(cache.get_key('kid1'), {'kid': 'kid1'})
+        self.assertEqual(cache.get_key('kid1'), {'kid': 'kid1'})
+        self.assertEqual(cache.fetches, 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_unknown_kid_refresh_is_rate_limited(self):
+        cache = StubJWKSCache({'kid1': {'kid': 'kid1'}},
+                              min_refresh_interval=60)
+        cache.get_key('kid1')
+
+        self.assertIsNone(cache.get_key('unknown'))
+        self.assertIsNone(cache.get_key('unknown'))
+        self.assertEqual(cache.fetches, 1)
+
+    def test_failed_fetch_keeps_last_good_keys(self):
+        cache = StubJWKSCache({'kid1': {'kid': 'kid1'}},
+                              min_refresh_interval=0)
+        cache.get_key('kid1')
+        cache.stub_keys = None
+
+        self.assertFalse(cache.refresh())
+        self.assertEqual(cache.get_key('kid1'), {'kid': 'kid1'})
+        self.assertEqual(cache.stats()['failures'], 1)
+
+
+class TokenCacheTest(TestCase):
+    """
+    Class for the verified token cache test cases
+    """
+
+    def test_cached_payload_is_returned(self):
+        cache = TokenCache()
+        payload = {'exp': time.time() + 60, 'permissions': ['get:actors']}
+        cache.set('token', payload)
+
+        self.assertIs(cache.get('token'), payload)
+        self.assertIsNone(cache.get('other token'))
+
+    def test_expired_payload_is_dropped(self):
+        cache = TokenCache()
+        cache.set('token', {'exp': time.time() - 1})
+
+        self.assertIsNone(cache.get('token'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TokenCache(max_size=2)
+        exp = time.time() + 60
+        cache.set('token1', {'exp': exp})
+        cache.set('token2', {'exp': exp})
+        cache.get('token1')
+        cache.set('token3', {'exp': exp})
+
+        self.assertIsNotNone(cache.get('token1'))
+        self.assertIsNone(cache.get('token2'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+class ResponseCacheTest(TestCase):
+    """
+    Class for the response cache test cases
+    """
+
+    def test_cached_response_is_returned(self):
+        cache = ResponseCache()
+        cache.set('etag', b'{}', 'application/json')
+
+        self.assertEqual(cache.get('etag'), (b'{}', 'application/json'))
+        self.assertIsNone(cache.get('other etag'))
+        self.assertEqual(cache.stats()['hit_rate'], 0.5)
+
+    def test_lookups_are_exported(self):
+        from prometheus_client import REGISTRY
+
+        def hits():
+            return REGISTRY.get_sample_value(
+                'capstone_response_cache_lookups_total', {'outcome': 'hit'})
+
+        before = hits() or 0
+        cache = ResponseCache()
+        cache.set('etag', b'{}', 'application/json')
+        cache.get('etag')
+
+        self.assertEqual(hits(), before + 1)
+
+    def test_expired_response_is_dropped(self):
+        cache = ResponseCache(ttl=0)
+        cache.set('etag', b'{}', 'application/json')
+
+        self.assertIsNone(cache.get('etag'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+
+class ConditionalTest(TestCase):
+    """
+    Class for the conditional request validator test cases
+    """
+
+    def test_last_modified_is_truncated_to_the_second(self):
+        updated_at = datetime.utcnow() - timedelta(seconds=5)
+        versions = {'Actor': (3, updated_at), 'Movie': (0, None)}
+
+        self.assertEqual(last_modified(versions),
+                         updated_at.replace(microsecond=0))
+
+    def test_no_last_modified_within_the_write_second(self):
+        versions = {'Actor': (3, datetime.utcnow())}
+
+        self.assertIsNone(last_modified(versions))
+
+
+class TableVersionTest(TestCase):
+    """
+    Class for the table version counter test cases
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        setup_db(self.app, f'sqlite:///{tempfile.mkdtemp()}/versions.db')
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def test_first_write_creates_the_version(self):
+        bump_versions('Actor')
+        db.session.commit()
+        bump_versions('Actor', 'Movie')
+        db.session.commit()
+
+        versions = get_versions('Actor', 'Movie', 'Career')
+        self.assertEqual(versions['Actor'][0], 2)
+        self.assertEqual(versions['Movie'][0], 1)
+        self.assertEqual(versions['Career'], (0, None))
+
+
+class ValidationTest(TestCase):
+    """
+    Class for the item validation test cases
+    """
+
+    def test_only_integer_ages_in_range_are_valid(self):
+        actor = {'name': 'actor', 'gender': 'female'}
+        rows, errors = validate_items(
+            [dict(actor, age=age)
+             for age in (30, '30', 0, True, 12.9, -5, 151, 'abc')],
+            validate_actor)
+
+        self.assertEqual([row['age'] for row in rows], [30, 30, 0])
+        self.assertEqual([error['index'] for error in errors],
+                         [3, 4, 5, 6, 7])
+
+
+class JSONProviderTest(TestCase):
+    """
+    Class for the JSON provider test cases
+    """
+
+    def test_dates_are_iso_8601_and_keys_sorted(self):
+        app = Flask(__name__)
+        body = {'release_date': datetime(2017, 10, 12), 'id': 1}
+
+        for name in JSON_PROVIDERS:
+            init_json_provider(app, name)
+            with app.app_context():
+                response = jsonify(body)
+
+            self.assertEqual(response.mimetype, 'application/json')
+            self.assertEqual(response.get_data(),
+                             b'{"id":1,"release_date":"2017-10-12T00:00:00"}')
+
+
+class PoolMonitorTest(TestCase):
+    """
+    Class for the connection pool gauge test cases
+    """
+
+    def setUp(self):
+        import db_pool
+
+        self.monitor = PoolMonitor()
+        self.default_monitor = db_pool.pool_monitor
+        db_pool.pool_monitor = self.monitor
+
+        self.engine = create_engine(
+            f'sqlite:///{tempfile.mkdtemp()}/pool.db',
+            poolclass=MonitoredQueuePool, pool_size=1, max_overflow=0,
+            pool_timeout=0.05)
+        self.monitor.attach(self.engine)
+
+    def tearDown(self):
+        import db_pool
+
+        self.engine.dispose()
+        db_pool.pool_monitor = self.default_monitor
+
+    def test_checked_out_connection_is_in_use(self):
+        connection = self.engine.connect()
+        stats = self.monitor.stats()
+        connection.close()
+
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['checkouts'], 1)
+        self.assertEqual(self.monitor.stats()['in_use'], 0)
+        self.assertEqual(self.monitor.stats()['idle'], 1)
+
+    def test_exhausted_pool_times_out(self):
+        connection = self.engine.connect()
+        with self.assertRaises(exc.TimeoutError):
+            self.engine.connect()
+        connection.close()
+
+        stats = self.monitor.stats()
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertEqual(stats['waiting'], 0)
+        self.assertGreaterEqual(stats['max_wait_seconds'], 0.05)
+
+    def test_pool_waits_are_exported(self):
+        from prometheus_client import REGISTRY
+
+        def timeouts():
+            return REGISTRY.get_sample_value(
+                'capstone_db_pool_wait_seconds_count',
+                {'outcome': 'timeout'}) or 0
+
+        before = timeouts()
+        connection = self.engine.connect()
+        with self.assertRaises(exc.TimeoutError):
+            self.engine.connect()
+        connection.close()
+
+        self.assertEqual(timeouts(), before + 1)
+
+
+class QueryLogTest(TestCase):
+    """
+    Class for the slow query log test cases
+    """
+
+    def test_parameter_shape_hides_values(self):
+        self.assertEqual(parameter_shape({'name': 'Ben', 'age': 30}),
+                         '{name: str, age: int}')
+        self.assertEqual(parameter_shape([('Ben', 30), ('Rey', 20)], True),
+                         '2 x (str, int)')
+
+
+class ReplicaTest(TestCase):
+    """
+    Routes reads between two SQLite files standing in for a primary and a
+    replica
+    """
+
+    def setUp(self):
+        database_dir = tempfile.mkdtemp()
+        replica_path = f'sqlite:///{database_dir}/replica.db'
+        with create_engine(replica_path).begin() as connection:
+            db.metadata.create_all(connection)
+            connection.execute(Actor.__table__.insert(), name='replica',
+                               age=30, gender='female')
+
+        self.app = Flask(__name__)
+        setup_db(self.app, f'sqlite:///{database_dir}/primary.db',
+                 [replica_path])
+        init_json_provider(self.app)
+        init_query_log(self.app, all_engines(self.app))
+        init_replicas(self.app)
+
+        @self.app.before_request
+        def set_subject():
+            # stands in for the `sub` requires_auth records
+            g.token_subject = request.headers.get('Subject')
+
+        @self.app.route('/actors')
+        @read_replica
+        def get_actors():
+            return jsonify([actor.name for actor in Actor.query.all()])
+
+        @self.app.route('/actors/count')
+        @read_replica
+        def count_actors():
+            Actor.query.count()
+            Actor.query.first()
+            return jsonify({'queries': g.db_queries})
+
+        @self.app.route('/actors', methods=['POST'])
+        def post_actors():
+            Actor('primary', 40, 'male').insert()
+            return jsonify({'success': True}), 201
+
+        self.client = self.app.test_client()
+
+    def test_reads_go_to_the_replica(self):
+        response = self.client.get('/actors')
+
+        self.assertEqual(response.get_json(), ['replica'])
+
+    def test_replica_queries_are_counted(self):
+        response = self.client.get('/actors/count')
+
+        self.assertEqual(response.get_json(), {'queries': 2})
+
+    def test_client_reads_its_writes_from_the_primary(self):
+        self.client.post('/actors')
+        response = self.client.get('/actors')
+
+        self.assertEqual(response.get_json(), ['primary'])
+
+    def test_subject_reads_its_writes_without_cookies(self):
+        headers = {'Subject': 'ingest|1'}
+        client = self.app.test_client(use_cookies=False)
+        client.post('/actors', headers=headers)
+
+        self.assertEqual(client.get('/actors', headers=headers).get_json(),
+                         ['primary'])
+        self.assertEqual(client.get('/actors', headers={
+            'Subject': 'dashboard|2'}).get_json(), ['replica'])
+
+    def test_other_clients_still_read_the_replica(self):
+        self.client.post('/actors')
+        response = self.app.test_client().get('/actors')
+
+        self.assertEqual(response.get_json(), ['replica'])
+
+
+class AdmissionTest(TestCase):
+    """
+    Class for the admission control test cases
+    """
+
+    def test_full_queue_is_rejected(self):
+        limiter = ConcurrencyLimiter('test', 1, queue_size=0)
+
+        self.assertIsNone(limiter.acquire())
+        self.assertEqual(limiter.acquire(), 'queue_full')
+        limiter.release()
+        self.assertIsNone(limiter.acquire())
+        self.assertEqual(limiter.stats()['rejected'], 1)
+
+    def test_queued_request_times_out(self):
+        limiter = ConcurrencyLimiter('test', 1, queue_size=1, timeout=0.01)
+
+        self.assertIsNone(limiter.acquire())
+        self.assertEqual(limiter.acquire(), 'timeout')
+        self.assertEqual(limiter.stats()['waiting'], 0)
+
+    def test_concurrent_request_is_turned_away(self):
+        import threading
+        import admission
+        import auth
+        from bench import LocalSigner, install_signer
+
+        app = create_app()
+        signer = LocalSigner()
+        jwks_cache = auth.jwks_cache
+        install_signer(signer)
+        limiters = dict(admission.limiters)
+        admission.limiters['read'] = ConcurrencyLimiter('read', 1,
+                                                        queue_size=0)
+
+        # the first request holds its admission until released
+        in_query = threading.Event()
+        release = threading.Event()
+
+        def block_first_request(*args):
+            if threading.current_thread().name == 'first':
+                in_query.set()
+                release.wait(5)
+
+        event.listen(db.engine, 'before_cursor_execute', block_first_request)
+        headers = {'Authorization':
+                   f'Bearer {signer.token(["get:actors"])}'}
+        responses = {}
+
+        def get_actors(name):
+            responses[name] = app.test_client().get('/actors',
+                                                    headers=headers)
+
+        first = threading.Thread(target=get_actors, args=('first',),
+                                 name='first')
+        try:
+            first.start()
+            self.assertTrue(in_query.wait(5))
+            get_actors('second')
+        finally:
+            release.set()
+            first.join()
+            event.remove(db.engine, 'before_cursor_execute',
+                         block_first_request)
+            admission.limiters.update(limiters)
+            auth.jwks_cache = jwks_cache
+            auth.token_cache.clear()
+
+        self.assertEqual(responses['first'].status_code, 200)
+        self.assertEqual(responses['second'].status_code, 503)
+        self.assertIn('Retry-After', responses['second'].headers)
+
+    def test_token_bucket_limits_each_subject(self):
+        buckets = TokenBuckets(rate=1, burst=2)
+
+        self.assertEqual(buckets.take('user|1'), 0)
+        self.assertEqual(buckets.take('user|1'), 0)
+        self.assertGreater(buckets.take('user|1'), 0)
+        self.assertEqual(buckets.take('user|2'), 0)
+
+
+class CompressionTest(TestCase):
+    """
+    Class for the response compression test cases
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        init_json_provider(self.app)
+        init_compression(self.app)
+        self.rows = [{'id': id, 'name': f'actor {id}'} for id in range(500)]
+
+        @self.app.route('/rows')
+        def rows():
+            return jsonify(self.rows)
+
+        @self.app.route('/small')
+        def small():
+            return jsonify(self.rows[:1])
+
+        @self.app.route('/stream')
+        def stream():
+            lines = (json.dumps(row) + '\n' for row in self.rows)
+            return self.app.response_class(lines,
+                                           mimetype='application/x-ndjson')
+
+        self.client = self.app.test_client()
+
+    def test_large_response_is_compressed(self):
+        response = self.client.get('/rows',
+                                   headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.data)),
+                         self.rows)
+
+    def test_small_response_is_not_compressed(self):
+        response = self.client.get('/small',
+                                   headers={'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+    def test_streamed_response_is_compressed(self):
+        response = self.client.get('/stream',
+                                   headers={'Accept-Encoding': 'gzip'})
+        lines = gzip.decompress(response.data).decode().splitlines()
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual([json.loads(line) for line in lines], self.rows)
+
+    def test_identity_without_accept_encoding(self):
+        response = self.client.get('/rows')
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_json(), self.rows)
+
+
+class CascadeTest(TestCase):
+    """
+    Checks that Career rows are removed by the database, not the ORM
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        setup_db(self.app, f'sqlite:///{tempfile.mkdtemp()}/cascade.db')
+        self.context = self.app.app_context()
+        self.context.push()
+
+        movie = Movie('title', datetime(2019, 10, 10))
+        movie.insert()
+        self.actors = [Actor(f'actor {i}', 30, 'female') for i in range(3)]
+        for actor in self.actors:
+            actor.insert()
+            CareerModel(actor.id, movie.id).insert()
+        self.movie_id = movie.id
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def test_deleting_a_movie_removes_its_careers(self):
+        Movie.query.get(self.movie_id).delete()
+
+        self.assertEqual(CareerModel.query.count(), 0)
+        self.assertEqual(Actor.query.count(), 3)
+
+    def test_linking_twice_keeps_one_career(self):
+        rows = [{'actor_id': self.actors[0].id, 'movie_id': self.movie_id}]
+        insert_careers(rows)
+        db.session.commit()
+
+        self.assertEqual(CareerModel.query.count(), 3)
+
+    def test_bulk_delete_removes_careers(self):
+        ids = [actor.id for actor in self.actors[:2]]
+        deleted = bulk_delete(Actor, ids + [9999999])
+        db.session.commit()
+
+        self.assertEqual(deleted, ids)
+        self.assertEqual(CareerModel.query.count(), 1)
+
+
+class ImportTest(TestCase):
+    """
+    Class for the resumable bulk import test cases
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        setup_db(self.app, f'sqlite:///{self.directory}/import.db')
+        self.context = self.app.app_context()
+        self.context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        self.context.pop()
+
+    def write_actors(self, lines):
+        path = os.path.join(self.directory, 'actors.ndjson')
+        with open(path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        return path
+
+    def actor_lines(self, count):
+        return [json.dumps({'name': f'actor {i}', 'age': 30,
+                            'gender': 'female'}) for i in range(count)]
+
+    def test_file_is_imported_in_batches(self):
+        path = self.write_actors(self.actor_lines(5))
+
+        self.assertEqual(import_file(path, 'actors', batch_size=2,
+                                     checkpoint='actors'), (5, 0))
+        self.assertEqual(Actor.query.count(), 5)
+        self.assertEqual(read_checkpoint('actors'), 5)
+
+    def test_invalid_lines_are_skipped(self):
+        lines = self.actor_lines(3)
+        path = self.write_actors([lines[0], '{"name": "broken', lines[1],
+                                  '{"name": "no age"}', lines[2]])
+
+        self.assertEqual(import_file(path, 'actors', batch_size=10,
+                                     checkpoint='actors'), (3, 2))
+        self.assertEqual(Actor.query.count(), 3)
+        self.assertEqual(read_checkpoint('actors'), 5)
+
+    def test_duplicate_and_dangling_careers_are_skipped(self):
+        movie = Movie('title', datetime(2019, 10, 10))
+        movie.insert()
+        actors = [Actor(f'actor {i}', 30, 'female') for i in range(2)]
+        for actor in actors:
+            actor.insert()
+        CareerModel(actors[1].id, movie.id).insert()
+
+        path = os.path.join(self.directory, 'careers.ndjson')
+        with open(path, 'w') as file:
+            for actor_id, movie_id in ((actors[0].id, movie.id),
+                                       (actors[0].id, movie.id),
+                                       (actors[1].id, movie.id),
+                                       (actors[0].id, 9999999),
+                                       (9999999, movie.id)):
+                file.write(json.dumps({'actor_id': actor_id,
+                                       'movie_id': movie_id}) + '\n')
+
+        self.assertEqual(import_file(path, 'careers', batch_size=10,
+                                     checkpoint='careers'), (1, 4))
+        self.assertEqual(CareerModel.query.count(), 2)
+        self.assertEqual(read_checkpoint('careers'), 5)
+
+    def test_interrupted_import_resumes_after_last_batch(self):
+        path = self.write_actors(self.actor_lines(5))
+        load_rows = importer.load_rows
+        calls = []
+
+        def failing_load_rows(model, rows):
+            calls.append(len(rows))
+            if len(calls) == 2:
+                raise OSError('connection lost')
+            return load_rows(model, rows)
+
+        importer.load_rows = failing_load_rows
+        try:
+            with self.assertRaises(OSError):
+                import_file(path, 'actors', batch_size=2,
+                            checkpoint='actors')
+        finally:
+            importer.load_rows = load_rows
+
+        self.assertEqual(Actor.query.count(), 2)
+        self.assertEqual(read_checkpoint('actors'), 2)
+        self.assertEqual(import_file(path, 'actors', batch_size=2,
+                                     checkpoint='actors'), (3, 0))
+        self.assertEqual(Actor.query.count(), 5)
+
+
+class DatasetTest(TestCase):
+    """
+    Class for the synthetic dataset generator test cases
+    """
+
+    def generated_rows(self, seed):
+        app = Flask(__name__)
+        setup_db(app, f'sqlite:///{tempfile.mkdtemp()}/dataset.db')
+        with app.app_context():
+            generate_dataset(50, 10, 200, seed=seed, batch_size=64)
+            rows = [
+                [model.format() for model in query.order_by('id').all()]
+                for query in (Actor.query, Movie.query)
+            ]
+            rows.append(db.session.query(CareerModel.actor_id,
+                                         CareerModel.movie_id)
+                        .order_by(CareerModel.id).all())
+            db.session.remove()
+
+        return rows
+
+    def test_same_seed_gives_same_rows(self):
+        self.assertEqual(self.generated_rows(7), self.generated_rows(7))
+        self.assertNotEqual(self.generated_rows(7), self.generated_rows(8))
+
+    def test_careers_do_not_repeat(self):
+        careers = [(row['actor_id'], row['movie_id'])
+                   for row in generate_careers(random.Random(1), 2000,
+                                               range(1, 101), range(1, 51))]
+
+        self.assertGreater(len(careers), 0)
+        self.assertEqual(len(careers), len(set(careers)))
+
+
+class MigrationTest(TestCase):
+    """
+    Checks that the migrations build the schema declared by the models
+    """
+
+    def test_migrations_match_models(self):
+        database_dir = tempfile.mkdtemp()
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = \
+            f'sqlite:///{database_dir}/migrations.db'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+        Migrate(app, db)
+
+        with app.app_context():
+            upgrade(directory=os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), 'migrations'))
+
+            with db.engine.connect() as connection:
+                context = MigrationContext.configure(connection, opts={
+                    'include_object':
+                        lambda obj, name, *args: not is_search_object(name)
+                })
+                diff = compare_metadata(context, db.metadata)
+
+        self.assertEqual(diff, [])
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+from datetime import datetime
+from dateutil import parser
+
+GENDERS = ('male', 'female', 'non-binary')
+MIN_AGE = 0
+MAX_AGE = 150
+
+
+def parse_date(value):
+    '''
+    parse_date(value)
+        ISO-8601 fast path, then any format dateutil understands;
+        raises ValueError
+    '''
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        try:
+            return parser.parse(str(value))
+        except (ValueError, OverflowError):
+            raise ValueError(f'invalid date: {value}')
+
+
+def parse_age(value):
+    '''
+    parse_age(value)
+        an integer age within MIN_AGE and MAX_AGE; strings of digits are
+        accepted for CSV imports, while booleans and floats are not
+    '''
+    if isinstance(value, str):
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError('age must be an integer')
+
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError('age must be an integer')
+
+    if not MIN_AGE <= value <= MAX_AGE:
+        raise ValueError(f'age must be between {MIN_AGE} and {MAX_AGE}')
+
+    return value
+
+
+def validate_actor(data):
+    '''
+    validate_actor(data)
+        returns an Actor row ready for insertion or raises ValueError
+    '''
+    if not isinstance(data, dict):
+        raise ValueError('an actor object is expected')
+
+    name = data.get('name', None)
+    age = data.get('age', None)
+    gender = data.get('gender', None)
+
+    if not name or age in (None, '') or not gender:
+        raise ValueError('name, age and gender are required')
+
+    if not isinstance(name, str):
+        raise ValueError('name must be a string')
+
+    age = parse_age(age)
+
+    if gender not in GENDERS:
+        raise ValueError(f'gender must be one of {", ".join(GENDERS)}')
+
+    return {'name': name, 'age': age, 'gender': gender}
+
+
+def validate_movie(data):
+    '''
+    validate_movie(data)
+        returns a Movie row ready for insertion or raises ValueError
+    '''
+    if not isinstance(data, dict):
+        raise ValueError('a movie object is expected')
+
+    title = data.get('title', None)
+    release_date = data.get('release_date', None)
+
+    if not title or not isinstance(title, str):
+        raise ValueError('title is required')
+
+    if release_date is None:
+        release_date = datetime.utcnow()
+    else:
+        try:
+            release_date = parse_date(release_date)
+        except ValueError:
+            raise ValueError('release_date must be a date')
+
+    return {'title': title, 'release_date': release_date}
+
+
+def validate_career(data):
+    '''
+    validate_career(data)
+        returns a Career row ready for insertion or raises ValueError
+    '''
+    if not isinstance(data, dict):
+        raise ValueError('a career object is expected')
+
+    try:
+        return {
+            'actor_id': int(data.get('actor_id', None)),
+            'movie_id': int(data.get('movie_id', None)),
+        }
+    except (TypeError, ValueError):
+        raise ValueError('actor_id and movie_id must be integers')
+
+
+def validate_items(items, validate):
+    '''
+    validate_items(items, validate)
+        validates every item up front and returns (rows, errors), where
+        errors lists the index and message of each invalid item
+    '''
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        try:
+            rows.append(validate(item))
+        except ValueError as ex:
+            errors.append({'index': index, 'message': str(ex)})
+
+    return rows, errors